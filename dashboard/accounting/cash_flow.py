@@ -1,40 +1,184 @@
-from accounting.transaction import Transaction, TransactionType
+from accounting.transaction import Transaction, TransactionType, description_category
+from accounting.receipts import ReceiptStore, is_digest
+import itertools
+from collections import Counter
 import json
+import os
+import shutil
+import threading
 import pandas as pd
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 from datetime import date
 import plotly.express as px
 from pathlib import Path
 
 
+# Number of journaled operations after which the snapshot is rewritten
+COMPACT_OPERATIONS = 100
+
+# Periods of the profit and loss rollups and the label of a date in each period
+PERIODS = {
+    "Month": lambda d: f"{d.year}-{d.month:02d}",
+    "Quarter": lambda d: f"{d.year}-Q{(d.month - 1) // 3 + 1}",
+}
+
+
+def accumulate(amounts: dict, counts: dict, key, amount: float, sign: int):
+    """
+    Add (sign 1) or remove (sign -1) an amount of a total, the key is dropped 
+    once it has no amounts left
+    """
+    amounts[key] = amounts.get(key, 0.0) + sign * amount
+    counts[key] = counts.get(key, 0) + sign
+    if counts[key] == 0:
+        del amounts[key]
+        del counts[key]
+
+
 class NoTransactionIDFound(Exception):
     pass
 
+class DuplicateTransaction(Exception):
+    pass
+
 class CashFlow:
     """
     Representation of the business cash flow
 
+    The ledger is stored as a snapshot of the transactions and a journal of the
+    operations made since then. Opening the ledger never writes, the changes are
+    appended to the journal on save and the snapshot is only rewritten when the
+    journal grows long, keeping the previous snapshot as backup.
+
     Attributes:
         past_transactions_path: path for the .json file containing all
         transactions history
+        receipts_path: directory of the receipt files, by default the 
+        receipts directory next to the transactions history
     """
-    def __init__(self, past_transactions_path:str):
+    def __init__(self, past_transactions_path:str, receipts_path: str = None):
         self.path = past_transactions_path
+        self.journal_path = f"{past_transactions_path}.journal"
+        self.backup_path = f"{past_transactions_path}_backup.json"
         with open(past_transactions_path, "r") as f:
             read_transactions = [
                 Transaction.__init_from_dict__(transaction_data)
                 for transaction_data in json.load(f)
             ]
-        
-        # List with all the past transactions
-        self.transactions : List[Transaction] = read_transactions
 
-        # Create a backup file
-        with open(f"{past_transactions_path}_backup.json", "w") as f:
-            json.dump(self.parsable_transactions(), f)
+        # The cash flow is shared by the sessions of the app, changes and the
+        # rebuilds of the cached frames are made holding the lock
+        self.lock = threading.RLock()
+
+        # Transactions by id, in the order they were added
+        self.index : Dict[int, Transaction] = {}
+
+        # Aggregates updated on every add and remove, so they never scan the ledger
+        self.balances : Dict[TransactionType, float] = {t: 0.0 for t in TransactionType}
+        # Total amount and number of transactions per date of each type
+        self.daily_amounts : Dict[TransactionType, Dict[date, float]] = {t: {} for t in TransactionType}
+        self.daily_counts : Dict[TransactionType, Dict[date, int]] = {t: {} for t in TransactionType}
+        # Total amount and number of transactions per period, type and description category
+        self.rollup_amounts : Dict[str, Dict[Tuple[str, str, str], float]] = {p: {} for p in PERIODS}
+        self.rollup_counts : Dict[str, Dict[Tuple[str, str, str], int]] = {p: {} for p in PERIODS}
+        # Cumulative series, profit and loss tables and dataframe, rebuilt only after a change
+        self._series : Dict[TransactionType, pd.DataFrame] = {}
+        self._pnl : Dict[str, pd.DataFrame] = {}
+        self._dataframe : pd.DataFrame = None
+        # Transactions saved without an id, or with the id of another one, get a new id
+        renumbered = False
+        for transaction in read_transactions:
+            if transaction.id is None or transaction.id in self.index:
+                transaction.id = self.new_id(transaction, unique=False)
+                renumbered = True
+            self.append(transaction)
+
+        # Operations not yet saved and number of operations in the journal
+        self.pending_operations : List[dict] = []
+        self.journaled_operations = 0
+        for operation in self.read_journal():
+            self.apply(operation)
+            self.journaled_operations += 1
+
+        # Transactions only keep references to the receipts, read when needed
+        self.receipts = ReceiptStore(
+            receipts_path or Path(past_transactions_path).parent / "receipts"
+        )
+        if self.migrate_receipts() or renumbered:
+            self.compact()
 
     def __len__(self):
-        return len(self.transactions)
+        return len(self.index)
+
+    @property
+    def transactions(self) -> List[Transaction]:
+        """
+        All the transactions, in the order they were added
+        """
+        return list(self.index.values())
+
+    def track(self, transaction: Transaction, sign: int):
+        """
+        Update the aggregates with an added (sign 1) or removed (sign -1) transaction
+        """
+        self.balances[transaction.type] += sign * transaction.amount
+        accumulate(
+            self.daily_amounts[transaction.type],
+            self.daily_counts[transaction.type],
+            transaction.date,
+            transaction.amount,
+            sign,
+        )
+        category = description_category(transaction.description)
+        for period, label in PERIODS.items():
+            accumulate(
+                self.rollup_amounts[period],
+                self.rollup_counts[period],
+                (label(transaction.date), transaction.type.name.capitalize(), category),
+                transaction.amount,
+                sign,
+            )
+
+        self._series.pop(transaction.type, None)
+        self._pnl = {}
+        self._dataframe = None
+
+    def append(self, transaction: Transaction):
+        self.index[transaction.id] = transaction
+        self.track(transaction, sign=1)
+
+    def delete(self, transaction: Transaction):
+        del self.index[transaction.id]
+        self.track(transaction, sign=-1)
+
+    def get_transaction(self, id: int) -> Transaction:
+        """
+        Transaction by id
+        """
+        try:
+            return self.index[id]
+        except KeyError:
+            raise NoTransactionIDFound
+
+    def migrate_receipts(self) -> bool:
+        """
+        Move the receipts embedded in base64 into the receipt store. Returns
+        True if any transaction was changed.
+        """
+        migrated = False
+        for transaction in self.transactions:
+            if transaction.file is None:
+                continue
+            if all(is_digest(x) for x in transaction.file):
+                continue
+
+            transaction.file = [
+                x if is_digest(x) else self.receipts.put_base64(x)
+                for x in transaction.file
+            ]
+            migrated = True
+
+        return migrated
     
     def parsable_transactions(self) -> List[Dict]:
         """
@@ -42,38 +186,135 @@ class CashFlow:
         """
         return [transaction.dict() for transaction in self.transactions]
     
-    def dump(self, parsable_transactions: List[Dict]):
+    def dump(self, parsable_transactions: List[Dict], backup: bool = False):
         """
-        Dump transactions
+        Dump transactions into the snapshot, atomically. With backup, the
+        previous snapshot is copied into the backup file first, so a snapshot
+        exists at every moment.
         """
-        with open(self.path, "w") as f:
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as f:
             json.dump(parsable_transactions, f)
+        if backup and os.path.exists(self.path):
+            shutil.copyfile(self.path, f"{self.backup_path}.tmp")
+            os.replace(f"{self.backup_path}.tmp", self.backup_path)
+        os.replace(temporary_path, self.path)
+
+    def read_journal(self) -> List[dict]:
+        """
+        Operations saved since the snapshot, a partially written last line is ignored
+        """
+        if not os.path.exists(self.journal_path):
+            return []
+
+        operations = []
+        with open(self.journal_path, "r") as f:
+            for line in f:
+                try:
+                    operations.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+
+        return operations
+
+    def apply(self, operation: dict):
+        """
+        Apply a journaled operation to the transactions. Operations are 
+        idempotent, so a journal replayed over a snapshot already including
+        it leaves the transactions unchanged.
+        """
+        if operation["operation"] == "add":
+            if operation["transaction"]["id"] not in self.index:
+                self.append(Transaction.__init_from_dict__(operation["transaction"]))
+        elif operation["operation"] == "remove":
+            if operation["id"] in self.index:
+                self.delete(self.index[operation["id"]])
+
+    def save(self):
+        """
+        Append the pending operations to the journal, nothing is written
+        when the ledger did not change
+        """
+        with self.lock:
+            if not self.pending_operations:
+                return None
+
+            with open(self.journal_path, "a") as f:
+                for operation in self.pending_operations:
+                    f.write(json.dumps(operation) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+            self.journaled_operations += len(self.pending_operations)
+            self.pending_operations = []
+
+            if self.journaled_operations >= COMPACT_OPERATIONS:
+                self.compact()
+
+    def compact(self):
+        """
+        Rewrite the snapshot with all the transactions and clear the journal.
+        The previous snapshot is kept as backup.
+        """
+        with self.lock:
+            self.dump(self.parsable_transactions(), backup=True)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+            self.journaled_operations = 0
+            self.pending_operations = []
     
-    def add_transaction(self, transaction: Transaction) -> None:
+    def has_transaction(self, id: int) -> bool:
+        try:
+            self.get_transaction(id)
+        except NoTransactionIDFound:
+            return False
+        return True
+
+    def new_id(self, transaction: Transaction, unique: bool = True) -> int:
+        """
+        Id of a new transaction, derived from its content. A transaction with 
+        the same content already in the cash flow is a duplicate; unless unique
+        is False, then it gets the next free id as any other collision.
+        """
+        for salt in itertools.count():
+            id = transaction.content_id(salt)
+            try:
+                existing = self.get_transaction(id)
+            except NoTransactionIDFound:
+                return id
+            if unique and existing.content() == transaction.content():
+                raise DuplicateTransaction
+
+    def add_transaction(self, transaction: Transaction, unique: bool = True) -> None:
         """
-        Add a transaction to the cash flow
+        Add a transaction to the cash flow, raises DuplicateTransaction if 
+        unique and the same transaction was already added
         """
-        transaction_dict = transaction.dict()
-        transaction_id = int(str(hash(frozenset(transaction_dict.items())))[:15])
-        transaction.id = transaction_id
-        self.transactions.append(transaction)
+        with self.lock:
+            transaction.id = self.new_id(transaction, unique=unique)
+            self.append(transaction)
+            self.pending_operations.append(
+                {"operation": "add", "transaction": transaction.dict()}
+            )
 
     def remove_transaction_by_index(self, idx: int):
         """
         Remove transaction by index
         """
-        del self.transactions[idx]
+        with self.lock:
+            self.remove_transaction_by_id(self.transactions[idx].id)
 
     def remove_transaction_by_id(self, id: int):
         """
         Remove transaction by id
         """
-        for idx, transaction in enumerate(self.transactions):
-            if transaction.id == id:
-                self.remove_transaction_by_index(idx)
-                return None
-            
-        raise NoTransactionIDFound
+        with self.lock:
+            transaction = self.get_transaction(id)
+            self.pending_operations.append(
+                {"operation": "remove", "id": transaction.id}
+            )
+            self.delete(transaction)
         
     def amazon_payment(
             self, 
@@ -94,8 +335,42 @@ class CashFlow:
             Amazon payment
             receipt: receipt of the amazon payment
         """
+        self.add_payment(
+            self.amazon_payment_transactions(
+                amount=amount,
+                date=date,
+                number_units_sold=number_units_sold,
+                cost_per_unit=cost_per_unit,
+                receipt=receipt,
+            )
+        )
+
+    def add_payment(self, transactions: List[Transaction], unique: bool = True):
+        """
+        Add the transactions of a payment, only the payment itself (the first 
+        transaction) is checked for duplicates, if unique, so two payments with
+        the same costs on the same date are both kept
+        """
+        payment, *movements = transactions
+        with self.lock:
+            self.add_transaction(payment, unique=unique)
+            for transaction in movements:
+                self.add_transaction(transaction, unique=False)
+
+    @staticmethod
+    def amazon_payment_transactions(
+            amount: float,
+            date: date,
+            number_units_sold: int,
+            cost_per_unit: int,  
+            receipt: List[str] = None,      
+    ) -> List[Transaction]:
+        """
+        Transactions of an Amazon payment: the payment, the inventory costs and
+        the split of the deserved profit
+        """
         # Payment Transaction
-        self.add_transaction(
+        transactions = [
             Transaction(
                 type=TransactionType.OPERATIONS,
                 date=date,
@@ -103,10 +378,10 @@ class CashFlow:
                 description="Amazon payment",
                 file=receipt,
             )
-        )
+        ]
         # Inventory Cash Flow
         cost_in_inventory = number_units_sold * cost_per_unit
-        self.add_transaction(
+        transactions.append(
             Transaction(
                 type=TransactionType.OPERATIONS,
                 date=date,
@@ -117,7 +392,7 @@ class CashFlow:
         # Profit cash flow
         profit_to_earn = (amount - cost_in_inventory) * 0.03
         if profit_to_earn > 0.0:
-            self.add_transaction(
+            transactions.append(
                 Transaction(
                     type=TransactionType.OPERATIONS,
                     date=date,
@@ -125,7 +400,7 @@ class CashFlow:
                     description="Deduct deserved profit",
                 )
             )
-            self.add_transaction(
+            transactions.append(
                 Transaction(
                     type=TransactionType.PROFIT,
                     date=date,
@@ -134,7 +409,64 @@ class CashFlow:
                 )
             )
 
+        return transactions
+
+    def amazon_settlements(self, settlements: pd.DataFrame, cost_per_unit: float) -> int:
+        """
+        Post the Amazon payments of settlement periods read by read_settlements,
+        skipping the settlements repeated in the import (same settlement id),
+        the ones already in the ledger (a payment with the same date and amount
+        each) and the ones still to be deposited. Returns the number of
+        settlements posted.
+        """
+        with self.lock:
+            df_payments = self.query(description="Amazon payment")
+            # The ledger does not keep the settlement ids, each payment matches one settlement
+            paid = Counter(
+                (payment_date, round(payment_amount, 2))
+                for payment_date, payment_amount in zip(df_payments["Date"], df_payments["Amount"])
+            )
+            imported = set()
+            transactions = []
+            for settlement_id, deposit_date, amount, units_sold in zip(
+                settlements["Settlement ID"],
+                settlements["Deposit Date"],
+                settlements["Amount"],
+                settlements["Units Sold"],
+            ):
+                if settlement_id in imported or deposit_date > date.today():
+                    continue
+                imported.add(settlement_id)
+                if paid[(deposit_date, round(amount, 2))] > 0:
+                    paid[(deposit_date, round(amount, 2))] -= 1
+                    continue
+                transactions.append(
+                    self.amazon_payment_transactions(
+                        amount=float(amount),
+                        date=deposit_date,
+                        number_units_sold=int(units_sold),
+                        cost_per_unit=cost_per_unit,
+                    )
+                )
+
+            # Settlements are already deduplicated, two with the same payment are both kept
+            for payment in transactions:
+                self.add_payment(payment, unique=False)
+
+            return len(transactions)
+
     def dataframe(self) -> pd.DataFrame:
+        """
+        Dataframe of the transactions, built once after each change. It is
+        shared by the callers, so it must not be modified in place.
+        """
+        with self.lock:
+            if self._dataframe is None:
+                self._dataframe = self.build_dataframe()
+
+            return self._dataframe
+
+    def build_dataframe(self) -> pd.DataFrame:
         return pd.DataFrame(
             {
                 "ID":[transaction.id for transaction in self.transactions],
@@ -146,6 +478,42 @@ class CashFlow:
             }
         ).sort_values("Date", ascending=False)
     
+    def query(
+            self,
+            start_date: Optional[date] = None,
+            end_date: Optional[date] = None,
+            transaction_type: Optional[TransactionType] = None,
+            description: Optional[str] = None,
+            with_file: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Transactions between two dates (both included), of a type, with a 
+        description or with files, the most recent first
+        """
+        df = self.dataframe()
+        mask = pd.Series(True, index=df.index)
+        if start_date is not None:
+            mask &= df["Date"] >= start_date
+        if end_date is not None:
+            mask &= df["Date"] <= end_date
+        if transaction_type is not None:
+            mask &= df["Type"] == transaction_type.name.capitalize()
+        if description is not None:
+            mask &= df["Description"] == description
+        if with_file:
+            mask &= df["File"]
+
+        return df[mask]
+    
+    def first_date(self) -> Optional[date]:
+        """
+        Date of the oldest transaction, None if the ledger is empty
+        """
+        return min(
+            (min(amounts) for amounts in self.daily_amounts.values() if amounts),
+            default=None,
+        )
+
     def accrual_operating_balance(self) -> float:
         """
         Resume of the accrued operating cash flow balance. This amount represents the reserves 
@@ -153,32 +521,74 @@ class CashFlow:
         only are stated when the amazon payment is received. This approach is best for keep
         tracking of your profit on a monthly basis
         """
-        return sum(
-            transaction.amount
-            for transaction in self.transactions
-            if transaction.type == TransactionType.OPERATIONS
-        )
+        return self.balances[TransactionType.OPERATIONS]
     
     def inventory_account_balance(self) -> float:
         """
         Balance of the money spend only for inventory purposes
         """
-        return sum(
-            transaction.amount 
-            for transaction in self.transactions 
-            if transaction.type == TransactionType.INVENTORY
-        )
+        return self.balances[TransactionType.INVENTORY]
     
     def profit(self) -> float:
         """
         Total Profit
         """
-        return sum(
-            transaction.amount 
-            for transaction in self.transactions 
-            if transaction.type == TransactionType.PROFIT
+        return self.balances[TransactionType.PROFIT]
+
+    def series(self, transaction_type: TransactionType) -> pd.DataFrame:
+        """
+        Daily and cumulative amounts of a transaction type, built from the daily
+        totals and only after a transaction of the type changed
+        """
+        with self.lock:
+            if transaction_type not in self._series:
+                amounts = self.daily_amounts[transaction_type]
+                df = pd.DataFrame(
+                    {
+                        "Date": list(amounts.keys()),
+                        "Amount": list(amounts.values()),
+                    },
+                    columns=["Date", "Amount"],
+                ).sort_values("Date", ignore_index=True)
+                df["CUM_AMOUNT"] = df["Amount"].cumsum()
+                df["Type"] = transaction_type.name.capitalize()
+                self._series[transaction_type] = df
+
+            return self._series[transaction_type]
+
+    def pnl(self, period: str = "Month") -> pd.DataFrame:
+        """
+        Profit and loss per period (Month or Quarter), type and description 
+        category, in long format and built from the rollups only after a change
+        """
+        with self.lock:
+            if period not in self._pnl:
+                amounts = self.rollup_amounts[period]
+                df = pd.DataFrame(
+                    [(*key, amount) for key, amount in amounts.items()],
+                    columns=["Period", "Type", "Category", "Amount"],
+                ).sort_values(["Period", "Type", "Category"], ignore_index=True)
+                self._pnl[period] = df
+
+            return self._pnl[period]
+
+    def pnl_table(self, period: str = "Month") -> pd.DataFrame:
+        """
+        Profit and loss with a row per type and category, a column per period
+        and the net result of the operations
+        """
+        df = self.pnl(period).pivot_table(
+            index=["Type", "Category"],
+            columns="Period",
+            values="Amount",
+            aggfunc="sum",
+            fill_value=0.0,
         )
-    
+        operations = df.loc[["Operations"]] if "Operations" in df.index else df.iloc[:0]
+        df.loc[("Operations", "Net"), :] = operations.sum()
+
+        return df
+
 
 class Visualizer:
     def __init__(self, cash_flow:CashFlow):
@@ -188,14 +598,23 @@ class Visualizer:
             self, 
             transaction_type:TransactionType,
     ) -> Tuple[px.line, pd.DataFrame]:
-        transaction_type_name = transaction_type.name.capitalize()
-        df = self.cash_flow.dataframe().query(
-                "Type == @transaction_type_name",
-            ).groupby(
-                "Date",
-            ).sum().reset_index().sort_values("Date")
-        df["CUM_AMOUNT"] = df["Amount"].cumsum()
-        df["Type"] = transaction_type_name
+        df = self.cash_flow.series(transaction_type)
         fig = px.line(df, x="Date", y="CUM_AMOUNT", color="Type", markers=True)
         return fig, df
+
+    def display_pnl(self, period: str = "Month") -> Tuple[px.bar, pd.DataFrame]:
+        """
+        Amounts per period of each description category, one row of bars per type
+        """
+        df = self.cash_flow.pnl(period)
+        fig = px.bar(
+            df, 
+            x="Period", 
+            y="Amount", 
+            color="Category", 
+            facet_row="Type",
+        )
+        fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+        fig.update_yaxes(matches=None)
+        return fig, df
             
\ No newline at end of file
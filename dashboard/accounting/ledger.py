@@ -0,0 +1,399 @@
+"""
+SQLite storage of the cash flow
+
+The transactions are kept in a SQLite file indexed by date, type and id, so the
+balances, series, profit and loss and filtered transactions are computed by the
+database instead of loading the whole ledger in memory.
+
+Import the transactions of a JSON ledger from the dashboard directory:
+    python -m accounting.ledger accounting/past_transactions.json --database accounting/ledger.db
+"""
+
+import argparse
+import json
+import sqlite3
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+import pandas as pd
+from accounting.cash_flow import CashFlow, NoTransactionIDFound
+from accounting.receipts import ReceiptStore
+from accounting.transaction import Transaction, TransactionType, description_category
+
+
+LEDGER_PATH = "accounting/ledger.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    type TEXT NOT NULL,
+    description TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount REAL NOT NULL,
+    file TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS transactions_id ON transactions (id);
+-- The amounts are part of the indexes, so the aggregates only read the indexes
+CREATE INDEX IF NOT EXISTS transactions_date ON transactions (date, type, category, amount);
+CREATE INDEX IF NOT EXISTS transactions_type ON transactions (type, date, amount);
+CREATE INDEX IF NOT EXISTS transactions_description ON transactions (description, date);
+"""
+
+# Label of the date in each period of the profit and loss, as in PERIODS
+PERIODS_SQL = {
+    "Month": "substr(date, 1, 7)",
+    "Quarter": "substr(date, 1, 4) || '-Q' || ((CAST(substr(date, 6, 2) AS INTEGER) + 2) / 3)",
+}
+
+TRANSACTIONS_SQL = """
+SELECT id, date, type, description, amount, file IS NOT NULL
+FROM transactions
+"""
+
+
+def transaction_row(transaction: Transaction) -> tuple:
+    return (
+        transaction.id,
+        str(transaction.date),
+        transaction.type.name,
+        transaction.description,
+        description_category(transaction.description),
+        transaction.amount,
+        json.dumps(transaction.file) if transaction.file is not None else None,
+    )
+
+
+def row_transaction(row: tuple) -> Transaction:
+    id, date_, type_, description, amount, file_ = row
+    return Transaction(
+        type=TransactionType[type_],
+        date=date.fromisoformat(date_),
+        amount=amount,
+        description=description,
+        file=json.loads(file_) if file_ is not None else None,
+        id=id,
+    )
+
+
+class SQLiteCashFlow(CashFlow):
+    """
+    Cash flow stored in a SQLite file
+
+    Every query runs in the database, nothing of the ledger is kept in memory
+    but the results of the last queries. The changes are written on save in a
+    single database transaction, until then only get_transaction sees them.
+
+    Attributes:
+        path: path of the SQLite file
+        receipts_path: directory of the receipt files, by default the
+        receipts directory next to the SQLite file
+    """
+    def __init__(self, path: Union[str, Path] = LEDGER_PATH, receipts_path: str = None):
+        self.path = path
+        with self.connect() as connection:
+            # Pages keep being read while a change is written
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+        self.migrate_categories()
+
+        # Changes and the cached query results are shared by the sessions of the app
+        self.lock = threading.RLock()
+
+        # Operations not yet saved and the transactions they add (or None if removed)
+        self.pending_operations : List[dict] = []
+        self.pending_transactions : Dict[int, Optional[Transaction]] = {}
+        # Results of the queries, cleared on save
+        self._balances : Dict[TransactionType, float] = None
+        self._series : Dict[TransactionType, pd.DataFrame] = {}
+        self._pnl : Dict[str, pd.DataFrame] = {}
+        self._dataframe : pd.DataFrame = None
+
+        self.receipts = ReceiptStore(
+            receipts_path or Path(path).parent / "receipts"
+        )
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def migrate_categories(self):
+        """
+        Recompute the stored description categories, which are stale once the
+        rules of DESCRIPTION_CATEGORIES change. Only the distinct descriptions
+        are categorized and only the stale ones are updated.
+        """
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT DISTINCT description, category FROM transactions"
+            ).fetchall()
+            connection.executemany(
+                "UPDATE transactions SET category = ? WHERE description = ?",
+                [
+                    (description_category(description), description)
+                    for description, category in rows
+                    if description_category(description) != category
+                ],
+            )
+
+    def __len__(self):
+        with self.connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    @property
+    def transactions(self) -> List[Transaction]:
+        """
+        All the transactions, in the order they were added
+        """
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT id, date, type, description, amount, file FROM transactions ORDER BY rowid"
+            ).fetchall()
+
+        return [row_transaction(row) for row in rows]
+
+    @property
+    def balances(self) -> Dict[TransactionType, float]:
+        with self.lock:
+            if self._balances is None:
+                with self.connect() as connection:
+                    rows = connection.execute(
+                        "SELECT type, SUM(amount) FROM transactions GROUP BY type"
+                    ).fetchall()
+                self._balances = {t: 0.0 for t in TransactionType}
+                for type_, amount in rows:
+                    self._balances[TransactionType[type_]] = amount
+
+            return self._balances
+
+    def import_transactions(self, transactions: List[Transaction]) -> int:
+        """
+        Insert transactions in a single database transaction, the ones already
+        in the ledger are skipped. Returns the number of transactions inserted.
+        """
+        with self.connect() as connection:
+            before = connection.total_changes
+            connection.executemany(
+                "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [transaction_row(transaction) for transaction in transactions],
+            )
+            inserted = connection.total_changes - before
+
+        self.clear()
+        return inserted
+
+    def clear(self):
+        """
+        Clear the results of the queries after a change
+        """
+        self._balances = None
+        self._series = {}
+        self._pnl = {}
+        self._dataframe = None
+
+    def append(self, transaction: Transaction):
+        # Added transactions are inserted on save
+        self.pending_transactions[transaction.id] = transaction
+
+    def delete(self, transaction: Transaction):
+        # Removed transactions are deleted on save
+        self.pending_transactions[transaction.id] = None
+
+    def remove_transaction_by_index(self, idx: int):
+        """
+        Remove transaction by index, in the order the transactions were added
+        """
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT id FROM transactions ORDER BY rowid LIMIT 1 OFFSET ?", (idx,)
+            ).fetchone()
+        if row is None:
+            raise IndexError(idx)
+
+        self.remove_transaction_by_id(row[0])
+
+    def get_transaction(self, id: int) -> Transaction:
+        """
+        Transaction by id, including the changes not yet saved
+        """
+        if id in self.pending_transactions:
+            if self.pending_transactions[id] is None:
+                raise NoTransactionIDFound
+            return self.pending_transactions[id]
+
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT id, date, type, description, amount, file FROM transactions WHERE id = ?",
+                (int(id),),
+            ).fetchone()
+        if row is None:
+            raise NoTransactionIDFound
+
+        return row_transaction(row)
+
+    def save(self):
+        """
+        Write the pending operations in a single database transaction, either
+        all of them are written or none
+        """
+        with self.lock:
+            if not self.pending_operations:
+                return None
+
+            with self.connect() as connection:
+                for operation in self.pending_operations:
+                    if operation["operation"] == "add":
+                        connection.execute(
+                            "INSERT OR IGNORE INTO transactions VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            transaction_row(Transaction.__init_from_dict__(operation["transaction"])),
+                        )
+                    elif operation["operation"] == "remove":
+                        connection.execute(
+                            "DELETE FROM transactions WHERE id = ?", (operation["id"],)
+                        )
+
+            self.pending_operations = []
+            self.pending_transactions = {}
+            self.clear()
+
+    def compact(self):
+        """
+        Nothing to rewrite, only the query planner statistics are refreshed
+        """
+        with self.connect() as connection:
+            connection.execute("PRAGMA optimize")
+
+    def select(self, where: str = "", parameters: tuple = ()) -> pd.DataFrame:
+        """
+        Transactions matching a condition, the most recent first
+        """
+        with self.connect() as connection:
+            rows = connection.execute(
+                f"{TRANSACTIONS_SQL} {where} ORDER BY date DESC, rowid DESC",
+                parameters,
+            ).fetchall()
+
+        df = pd.DataFrame(
+            rows,
+            columns=["ID", "Date", "Type", "Description", "Amount", "File"],
+        )
+        df["Date"] = pd.to_datetime(df["Date"], format="%Y-%m-%d").dt.date
+        df["Type"] = df["Type"].str.capitalize()
+        df["File"] = df["File"].astype(bool)
+
+        return df
+
+    def build_dataframe(self) -> pd.DataFrame:
+        return self.select()
+
+    def query(
+            self,
+            start_date: Optional[date] = None,
+            end_date: Optional[date] = None,
+            transaction_type: Optional[TransactionType] = None,
+            description: Optional[str] = None,
+            with_file: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Transactions between two dates (both included), of a type, with a
+        description or with files, the most recent first
+        """
+        conditions : List[str] = []
+        parameters : List[str] = []
+        if start_date is not None:
+            conditions.append("date >= ?")
+            parameters.append(str(start_date))
+        if end_date is not None:
+            conditions.append("date <= ?")
+            parameters.append(str(end_date))
+        if transaction_type is not None:
+            conditions.append("type = ?")
+            parameters.append(transaction_type.name)
+        if description is not None:
+            conditions.append("description = ?")
+            parameters.append(description)
+        if with_file:
+            conditions.append("file IS NOT NULL")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        return self.select(where, tuple(parameters))
+
+    def first_date(self) -> Optional[date]:
+        """
+        Date of the oldest transaction, read from the date index
+        """
+        with self.connect() as connection:
+            first = connection.execute("SELECT MIN(date) FROM transactions").fetchone()[0]
+
+        return date.fromisoformat(first) if first is not None else None
+
+    def series(self, transaction_type: TransactionType) -> pd.DataFrame:
+        """
+        Daily and cumulative amounts of a transaction type
+        """
+        with self.lock:
+            if transaction_type not in self._series:
+                with self.connect() as connection:
+                    rows = connection.execute(
+                        """
+                        SELECT date, SUM(amount) FROM transactions
+                        WHERE type = ? GROUP BY date ORDER BY date
+                        """,
+                        (transaction_type.name,),
+                    ).fetchall()
+                df = pd.DataFrame(rows, columns=["Date", "Amount"])
+                df["Date"] = pd.to_datetime(df["Date"], format="%Y-%m-%d").dt.date
+                df["CUM_AMOUNT"] = df["Amount"].cumsum()
+                df["Type"] = transaction_type.name.capitalize()
+                self._series[transaction_type] = df
+
+            return self._series[transaction_type]
+
+    def pnl(self, period: str = "Month") -> pd.DataFrame:
+        """
+        Profit and loss per period (Month or Quarter), type and description
+        category, in long format
+        """
+        with self.lock:
+            if period not in self._pnl:
+                with self.connect() as connection:
+                    rows = connection.execute(
+                        f"""
+                        SELECT {PERIODS_SQL[period]} AS period, type, category, SUM(amount)
+                        FROM transactions GROUP BY period, type, category
+                        """
+                    ).fetchall()
+                df = pd.DataFrame(rows, columns=["Period", "Type", "Category", "Amount"])
+                df["Type"] = df["Type"].str.capitalize()
+                self._pnl[period] = df.sort_values(
+                    ["Period", "Type", "Category"],
+                    ignore_index=True,
+                )
+
+            return self._pnl[period]
+
+
+def open_cash_flow(path: str) -> CashFlow:
+    """
+    Cash flow of a ledger, a .db file is opened with the SQLite storage and
+    any other file as a JSON ledger
+    """
+    if Path(path).suffix == ".db":
+        return SQLiteCashFlow(path)
+
+    return CashFlow(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a JSON ledger into the SQLite ledger")
+    parser.add_argument("path", help="Path of the JSON ledger")
+    parser.add_argument("--database", default=LEDGER_PATH)
+    args = parser.parse_args()
+
+    ledger = SQLiteCashFlow(args.database)
+    number_transactions = ledger.import_transactions(CashFlow(args.path).transactions)
+    print(f"{number_transactions} transactions imported into {args.database}")
+
+
+if __name__ == "__main__":
+    main()
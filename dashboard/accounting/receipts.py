@@ -0,0 +1,272 @@
+import hashlib
+import io
+import os
+import re
+import json
+import base64
+import threading
+import PIL.Image
+import fitz
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+
+# Receipts are referenced in the transactions by the sha256 of their content
+DIGEST_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+# Zoom of the PDF pages rendered as images
+PDF_ZOOM = 2
+# JPEG quality of the page previews
+PREVIEW_QUALITY = 80
+# Maximum width and height of the page thumbnails
+THUMBNAIL_SIZE = (256, 256)
+# Number of receipts processed at the same time
+MAX_WORKERS = 2
+
+# PyMuPDF is not thread safe, documents are rendered one at a time
+PDF_LOCK = threading.Lock()
+
+
+class InvalidReceipt(Exception):
+    pass
+
+
+def is_digest(reference: str) -> bool:
+    return DIGEST_PATTERN.fullmatch(reference) is not None
+
+
+def open_pdf(content: bytes) -> fitz.Document:
+    """
+    PDF document of a receipt, to be used holding PDF_LOCK. Raises
+    InvalidReceipt if the content is not a PDF.
+    """
+    try:
+        return fitz.open("pdf", content)
+    except RuntimeError as error:
+        raise InvalidReceipt from error
+
+
+def page_count(content: bytes) -> int:
+    """
+    Number of pages of a document, an image or a PDF. Raises InvalidReceipt
+    if it is neither or can not be read.
+    """
+    try:
+        PIL.Image.open(io.BytesIO(content)).load()
+        return 1
+    except PIL.UnidentifiedImageError:
+        pass
+    except (OSError, SyntaxError) as error:
+        # An image that is truncated or corrupted
+        raise InvalidReceipt from error
+
+    with PDF_LOCK:
+        number_pages = open_pdf(content).page_count
+    if number_pages == 0:
+        raise InvalidReceipt
+
+    return number_pages
+
+
+def render_pages(content: bytes) -> List[PIL.Image.Image]:
+    """
+    Pages of a document, an image or a PDF, as images. Raises InvalidReceipt
+    if it is neither.
+    """
+    try:
+        return [PIL.Image.open(io.BytesIO(content))]
+    except PIL.UnidentifiedImageError:
+        pass
+
+    with PDF_LOCK:
+        pdf = open_pdf(content)
+        matrix = fitz.Matrix(PDF_ZOOM, PDF_ZOOM)
+        pages = [
+            pdf_page.get_pixmap(matrix=matrix).tobytes()
+            for pdf_page in pdf
+        ]
+
+    return [PIL.Image.open(io.BytesIO(page)) for page in pages]
+
+
+def to_jpeg(image: PIL.Image.Image) -> bytes:
+    stream = io.BytesIO()
+    image.convert("RGB").save(stream, format="JPEG", quality=PREVIEW_QUALITY, optimize=True)
+    return stream.getvalue()
+
+
+class ReceiptStore:
+    """
+    Content addressed store of transaction receipts
+
+    Each receipt is saved once in a file named after the sha256 of its content,
+    so the same document attached to several transactions is only stored once
+    and the transactions only keep the digests.
+
+    Attributes:
+        path: directory of the receipt files
+    """
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+
+    def file_path(self, digest: str) -> Path:
+        # Files are spread over subdirectories named after the first digest characters
+        return self.path / digest[:2] / digest
+
+    def exists(self, digest: str) -> bool:
+        return self.file_path(digest).exists()
+
+    def put(self, content: bytes) -> str:
+        """
+        Save a receipt, returns its digest
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.file_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temporary_path = path.with_name(f"{digest}.{threading.get_ident()}.tmp")
+            temporary_path.write_bytes(content)
+            os.replace(temporary_path, path)
+
+        return digest
+
+    def put_base64(self, content_b64: str) -> str:
+        return self.put(base64.b64decode(content_b64))
+
+    def get(self, digest: str) -> bytes:
+        return self.file_path(digest).read_bytes()
+
+    def image(self, digest: str) -> PIL.Image.Image:
+        return PIL.Image.open(io.BytesIO(self.get(digest)))
+
+    def previews_path(self, digest: str) -> Path:
+        return self.path / "previews" / f"{digest}.json"
+
+    def processed(self, digest: str) -> bool:
+        return self.previews_path(digest).exists()
+
+    def previews(self, digest: str) -> Optional[Dict[str, List[str]]]:
+        """
+        Digests of the page previews and thumbnails of a receipt, None until processed
+        """
+        path = self.previews_path(digest)
+        if not path.exists():
+            return None
+
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def put_previews(self, digest: str, previews: Dict[str, List[str]]):
+        path = self.previews_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_path = path.with_name(f"{digest}.json.{threading.get_ident()}.tmp")
+        with open(temporary_path, "w") as f:
+            json.dump(previews, f)
+        os.replace(temporary_path, path)
+
+    def process(self, digest: str) -> Dict[str, List[str]]:
+        """
+        Render the pages of a receipt into compressed previews and thumbnails
+        """
+        previews = {"pages": [], "thumbnails": []}
+        for page in render_pages(self.get(digest)):
+            previews["pages"].append(self.put(to_jpeg(page)))
+            page.thumbnail(THUMBNAIL_SIZE)
+            previews["thumbnails"].append(self.put(to_jpeg(page)))
+        self.put_previews(digest, previews)
+
+        return previews
+
+    def thumbnails(self, digest: str) -> List[bytes]:
+        """
+        Thumbnails of the pages of a receipt as JPEG, processing it if needed
+        """
+        previews = self.previews(digest) or self.process(digest)
+        return [self.get(thumbnail) for thumbnail in previews["thumbnails"]]
+
+    def images(self, digest: str) -> List[PIL.Image.Image]:
+        """
+        Page images of a receipt, the previews once processed or else the original pages
+        """
+        previews = self.previews(digest)
+        if previews is None:
+            return render_pages(self.get(digest))
+
+        return [self.image(page) for page in previews["pages"]]
+
+
+class ReceiptProcessor:
+    """
+    Background processing of the uploaded receipts
+
+    The original document is saved in the store right away, the previews and
+    thumbnails of its pages are generated by a pool of worker threads. Receipts
+    whose processing failed are not scheduled again.
+    """
+    def __init__(self, receipts: ReceiptStore, max_workers: int = MAX_WORKERS):
+        self.receipts = receipts
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, 
+            thread_name_prefix="receipts",
+        )
+        self.lock = threading.Lock()
+        # Receipts of the current batch being processed
+        self.futures : Dict[str, Future] = {}
+        # Receipts whose processing raised an error
+        self.failed : Set[str] = set()
+
+    def submit(self, content: bytes) -> str:
+        """
+        Save a receipt and schedule the processing of its pages, returns its
+        digest. Raises InvalidReceipt, before saving it, if the document can
+        not be read.
+        """
+        page_count(content)
+        digest = self.receipts.put(content)
+        self.schedule(digest)
+
+        return digest
+
+    def schedule(self, digest: str):
+        """
+        Schedule the processing of the pages of a saved receipt, unless it is 
+        already processed or being processed
+        """
+        with self.lock:
+            if (
+                digest not in self.futures
+                and digest not in self.failed
+                and not self.receipts.processed(digest)
+            ):
+                self.futures[digest] = self.executor.submit(self.receipts.process, digest)
+
+    def collect_failures(self):
+        """
+        Record the receipts of the current batch whose processing raised, to
+        be used holding the lock
+        """
+        for digest, future in self.futures.items():
+            if future.done() and future.exception() is not None:
+                self.failed.add(digest)
+
+    def has_failed(self, digest: str) -> bool:
+        with self.lock:
+            self.collect_failures()
+            return digest in self.failed
+
+    def progress(self) -> Tuple[int, int, int]:
+        """
+        Number of processed receipts, failed receipts and total receipts of
+        the current batch, a finished batch is cleared
+        """
+        with self.lock:
+            self.collect_failures()
+            done = sum(future.done() for future in self.futures.values())
+            failed = sum(digest in self.failed for digest in self.futures)
+            total = len(self.futures)
+            if done == total:
+                self.futures = {}
+
+        return done - failed, failed, total
+
@@ -0,0 +1,124 @@
+"""
+Amazon settlement reports (flat file V2)
+
+The reports are tab separated with a row per amount of each order, refund or
+fee. The first row of a settlement holds its summary: period, deposit date and
+total amount paid. Reports are read in chunks, so a year of settlements is
+aggregated without loading every row in memory.
+"""
+
+import pandas as pd
+from typing import List
+
+
+# Number of rows read at once
+CHUNK_SIZE = 50_000
+
+SETTLEMENT_COLUMNS = [
+    "settlement-id",
+    "settlement-start-date",
+    "settlement-end-date",
+    "deposit-date",
+    "total-amount",
+    "transaction-type",
+    "amount-description",
+    "quantity-purchased",
+]
+
+
+def parse_dates(values: pd.Series) -> pd.Series:
+    """
+    Dates of the report, in ISO (2023-10-05 10:22:33 UTC) or European
+    (05.10.2023 10:22:33 UTC) format depending on the marketplace
+    """
+    values = values.str.replace(" UTC", "", regex=False).str.strip()
+    dates = pd.to_datetime(values, format="ISO8601", errors="coerce")
+    european = pd.to_datetime(values, format="%d.%m.%Y %H:%M:%S", errors="coerce")
+
+    return dates.fillna(european).dt.date
+
+
+def parse_amounts(values: pd.Series) -> pd.Series:
+    """
+    Amounts of the report, with a decimal comma in the European marketplaces
+    (1.234,56) and thousands commas in the others (1,234.56 or 1,234)
+    """
+    values = values.str.strip()
+    # A comma is decimal when it is the last separator and has 1 or 2 digits after it
+    decimal_comma = values.str.contains(r",\d{1,2}$", regex=True) & (
+        values.str.rfind(",") > values.str.rfind(".")
+    )
+    values = values.where(
+        decimal_comma,
+        values.str.replace(",", "", regex=False),
+    ).where(
+        ~decimal_comma,
+        values.str.replace(".", "", regex=False).str.replace(",", ".", regex=False),
+    )
+
+    return pd.to_numeric(values, errors="coerce")
+
+
+def read_settlements(uploader, chunksize: int = CHUNK_SIZE) -> pd.DataFrame:
+    """
+    Settlement periods of a settlement report, with the amount paid by Amazon
+    and the number of units sold in each period
+    """
+    partials : List[pd.DataFrame] = []
+    for chunk in pd.read_csv(
+        uploader,
+        sep="\t",
+        dtype=str,
+        usecols=lambda column: column in SETTLEMENT_COLUMNS,
+        chunksize=chunksize,
+    ):
+        # Units are counted once per order item, on the principal amount
+        is_sale = (
+            (chunk["transaction-type"] == "Order") 
+            & (chunk["amount-description"] == "Principal")
+        )
+        chunk["units"] = pd.to_numeric(
+            chunk["quantity-purchased"], 
+            errors="coerce",
+        ).where(is_sale, 0).fillna(0)
+
+        partials.append(
+            chunk.groupby("settlement-id").agg(
+                start=("settlement-start-date", "first"),
+                end=("settlement-end-date", "first"),
+                deposit=("deposit-date", "first"),
+                total=("total-amount", "first"),
+                units=("units", "sum"),
+            )
+        )
+
+    if not partials:
+        return pd.DataFrame(
+            columns=["Settlement ID", "Start Date", "End Date", "Deposit Date", "Amount", "Units Sold"]
+        )
+
+    # Settlements split between chunks are aggregated again
+    df = pd.concat(partials).groupby(level=0).agg(
+        start=("start", "first"),
+        end=("end", "first"),
+        deposit=("deposit", "first"),
+        total=("total", "first"),
+        units=("units", "sum"),
+    ).dropna(subset=["deposit", "total"])
+
+    settlements = pd.DataFrame(
+        {
+            "Settlement ID": df.index,
+            "Start Date": parse_dates(df["start"]).to_numpy(),
+            "End Date": parse_dates(df["end"]).to_numpy(),
+            "Deposit Date": parse_dates(df["deposit"]).to_numpy(),
+            "Amount": parse_amounts(df["total"]).to_numpy(),
+            "Units Sold": df["units"].astype(int).to_numpy(),
+        }
+    )
+    # Settlements with an unreadable deposit date or amount are left out
+    settlements = settlements[
+        settlements["Deposit Date"].notna() & settlements["Amount"].notna()
+    ]
+
+    return settlements.sort_values("Deposit Date", ignore_index=True)
@@ -1,9 +1,11 @@
+import hashlib
+import json
+import re
 from enum import Enum, auto
 from datetime import date, datetime
 from dataclasses import dataclass
 from typing import List
-import base64
-import io
+from accounting.receipts import ReceiptStore
 import PIL
 
 
@@ -17,6 +19,42 @@ class TransactionType(Enum):
     PROFIT = auto()
 
 
+# Hexadecimal digits of the content digest kept in the transaction ids, 
+# 52 bits so they stay exact as JSON numbers
+ID_HEX_DIGITS = 13
+
+# Category of a transaction by the words of its description, the first match wins
+DESCRIPTION_CATEGORIES = {
+    "amazon payment": "Amazon Payments",
+    "inventory": "Inventory Costs",
+    "profit": "Profit",
+    "helium10": "Software",
+    "canva": "Software",
+    "ad": "Advertising",
+    "inspection": "Inspections",
+    "sample": "Samples",
+    "photography": "Photography",
+}
+
+
+# Words are matched whole, in singular or plural, so "ad" matches "Ads" but not "pads"
+DESCRIPTION_PATTERNS = {
+    re.compile(rf"\b{re.escape(words)}s?\b", re.IGNORECASE): category
+    for words, category in DESCRIPTION_CATEGORIES.items()
+}
+
+
+def description_category(description: str) -> str:
+    """
+    Category of a transaction description, Other if no category matches
+    """
+    for pattern, category in DESCRIPTION_PATTERNS.items():
+        if pattern.search(description):
+            return category
+
+    return "Other"
+
+
 @dataclass
 class Transaction:
     """
@@ -27,7 +65,7 @@ class Transaction:
     amount: float
     description: str
     # List of files associated with the
-    # transaction in base64
+    # transaction, as digests of the ReceiptStore
     file: List[str] = None
     id: int = None
 
@@ -47,16 +85,33 @@ class Transaction:
         if self.date > date.today():
             raise ValueError("Transaction date is in the future.")
         
-    def file_images(self):
+    def file_images(self, receipts: ReceiptStore) -> List[PIL.Image.Image]:
         """
-        Get a list of PIL images for the file
+        Get a list of PIL images for the file, read from the receipt store
         """
-        images = []
-        for x in self.file:
-            image = PIL.Image.open(io.BytesIO(base64.b64decode(x)))
-            images.append(image)
-        
-        return images
+        return [
+            image 
+            for digest in self.file 
+            for image in receipts.images(digest)
+        ]
+
+    def content(self) -> dict:
+        """
+        Parsable dictionary without the id
+        """
+        content = self.dict()
+        del content["id"]
+        return content
+
+    def content_id(self, salt: int = 0) -> int:
+        """
+        Id derived from the content of the transaction, the same in every 
+        process. A salt gives the next candidates when the id is taken.
+        """
+        key = json.dumps(self.content(), sort_keys=True)
+        if salt:
+            key = f"{key}#{salt}"
+        return int(hashlib.sha256(key.encode()).hexdigest()[:ID_HEX_DIGITS], 16)
 
     def dict(self) -> dict:
         """
@@ -1,58 +1,81 @@
 import streamlit as st
 from datetime import date
 from accounting.transaction import Transaction, TransactionType
-from accounting.cash_flow import CashFlow, Visualizer, NoTransactionIDFound
-import PIL
-import io
-import fitz
-import base64
+from accounting.cash_flow import CashFlow, Visualizer, NoTransactionIDFound, DuplicateTransaction
+from accounting.receipts import InvalidReceipt, ReceiptProcessor, ReceiptStore
+from accounting.settlements import read_settlements
+from accounting.ledger import open_cash_flow
+import pandas as pd
+import numpy as np
 from typing import List
 
 
-def base64_to_pil(image_b64):
-    return PIL.Image.open(io.BytesIO(base64.b64decode(image_b64)))
+# Ledger of the cash flow, a .db file keeps it in SQLite instead of JSON
+LEDGER_PATH = "accounting/past_transactions.json"
+# Number of receipts per page of the gallery and per row
+GALLERY_PAGE_SIZE = 12
+GALLERY_COLUMNS = 4
+# Maximum number of receipts with thumbnails kept in memory
+THUMBNAIL_CACHE_ENTRIES = 512
 
 
-def pil_to_base64(image) -> str:
-    stream = io.BytesIO()
-    image.save(stream, format="PNG")
-    img_b64 = base64.b64encode(stream.getvalue()).decode("utf-8")
-    return img_b64
+def get_file(file, processor: ReceiptProcessor) -> List[str]:
+    """
+    Save an uploaded document in the receipt store, its previews are generated 
+    in the background. Returns the digest of the document, raises 
+    InvalidReceipt if it can not be read.
+    """
+    return [processor.submit(file.getvalue())]
 
 
-def get_file(file) -> List[str]:
-    # To read file as bytes:
-    bytes_data = file.getvalue()
-    try:
-        images = [PIL.Image.open(io.BytesIO(bytes_data))]
-    except PIL.UnidentifiedImageError:
-        pdf = fitz.open("pdf", bytes_data)
-        zoom = 2
-        mat = fitz.Matrix(zoom, zoom)
-        images = []
-        for i, pdf_page in enumerate(pdf):
-            pix = pdf_page.get_pixmap(matrix=mat)
-            images.append(PIL.Image.open(io.BytesIO(pix.tobytes())))
-            
-    images_b64 = []
-    for image in images:
-        images_b64.append(pil_to_base64(image))
-        
-    return images_b64
+@st.cache_data(max_entries=THUMBNAIL_CACHE_ENTRIES, show_spinner=False)
+def receipt_thumbnails(_receipts: ReceiptStore, digest: str) -> List[bytes]:
+    """
+    Thumbnails of a processed receipt, cached by its digest, as a receipt 
+    never changes
+    """
+    return _receipts.thumbnails(digest)
+
+
+@st.cache_resource
+def load_cash_flow(past_transactions_path: str) -> CashFlow:
+    """
+    Cash flow kept across reruns, its balances and series are updated on 
+    every change (JSON) or queried from the database (SQLite) instead of 
+    recomputed from the whole ledger. It is shared by every session, so its
+    changes are made holding its lock.
+    """
+    return open_cash_flow(past_transactions_path)
+
+
+@st.cache_resource
+def load_receipt_processor(past_transactions_path: str) -> ReceiptProcessor:
+    """
+    Worker pool processing the receipts of the cash flow, shared by the reruns
+    """
+    return ReceiptProcessor(load_cash_flow(past_transactions_path).receipts)
 
 
 def app():
     
-    cash_flow = CashFlow(
-        past_transactions_path="accounting/past_transactions.json",
-    )
+    cash_flow = load_cash_flow(LEDGER_PATH)
+    receipt_processor = load_receipt_processor(LEDGER_PATH)
 
     st.title("Accounting")
 
     st.sidebar.write("- Number of Transactions: ", len(cash_flow))
-    df_payments = cash_flow.dataframe().query("Description == 'Amazon payment'")
+    df_payments = cash_flow.query(description="Amazon payment")
     number_of_amazon_payments = len(df_payments)
     st.sidebar.write("- Number of Amazon Payments: ", number_of_amazon_payments)
+    processed_receipts, failed_receipts, total_receipts = receipt_processor.progress()
+    if processed_receipts + failed_receipts < total_receipts:
+        st.sidebar.progress(
+            (processed_receipts + failed_receipts) / total_receipts,
+            text=f"Processing receipts: {processed_receipts + failed_receipts} of {total_receipts}",
+        )
+        st.sidebar.button("Refresh")
+    if failed_receipts:
+        st.sidebar.warning(f"{failed_receipts} receipts could not be processed.")
 
     with st.sidebar:
         with st.form("insert-transaction"):
@@ -75,22 +98,28 @@ def app():
             submit_transaction = st.form_submit_button("Submit")
         
         if submit_transaction:
-            if transaction_file is not None:
-                transaction_images_b64 = get_file(transaction_file)
+            try:
+                if transaction_file is not None:
+                    transaction_receipts = get_file(transaction_file, receipt_processor)
+                else:
+                    transaction_receipts = None
+
+                transaction = Transaction(
+                    type=TransactionType[transaction_type.upper()],
+                    date=transaction_date,
+                    amount=transaction_amount,
+                    description= transation_description,
+                    file=transaction_receipts,
+                )
+                cash_flow.add_transaction(transaction)
+            except InvalidReceipt:
+                st.error("Document could not be read, upload an image or a PDF.")
+            except DuplicateTransaction:
+                st.error("Transaction already added.")
             else:
-                transaction_images_b64 = None
-
-            transaction = Transaction(
-                type=TransactionType[transaction_type.upper()],
-                date=transaction_date,
-                amount=transaction_amount,
-                description= transation_description,
-                file=transaction_images_b64,
-            )
-            cash_flow.add_transaction(transaction)
-            cash_flow.dump(cash_flow.parsable_transactions())
-            st.success("Transação added with success.")
-            st.experimental_rerun()
+                cash_flow.save()
+                st.success("Transação added with success.")
+                st.experimental_rerun()
         
         with st.form("remove-transaction"):
             st.header("**Remove Transaction**")
@@ -103,7 +132,7 @@ def app():
             except NoTransactionIDFound:
                 st.error("Transaction ID not found.")
             else:
-                cash_flow.dump(cash_flow.parsable_transactions())
+                cash_flow.save()
                 st.success("Transaction removed with success.")
                 st.experimental_rerun()
 
@@ -127,21 +156,61 @@ def app():
             submit_payment = st.form_submit_button("Submit")
             
         if submit_payment:
-            if payment_file is not None:
-                payment_images_b64 = get_file(payment_file)
+            try:
+                if payment_file is not None:
+                    payment_receipts = get_file(payment_file, receipt_processor)
+                else:
+                    payment_receipts = None
+
+                cash_flow.amazon_payment(
+                    amount=payment_amount,
+                    date=payment_date,
+                    number_units_sold=payment_number_units,
+                    cost_per_unit=payment_cost_per_unit,
+                    receipt=payment_receipts, 
+                )
+            except InvalidReceipt:
+                st.error("Receipt could not be read, upload an image or a PDF.")
+            except DuplicateTransaction:
+                st.error("Amazon Payment already added.")
             else:
-                payment_images_b64 = None
-            
-            cash_flow.amazon_payment(
-                amount=payment_amount,
-                date=payment_date,
-                number_units_sold=payment_number_units,
-                cost_per_unit=payment_cost_per_unit,
-                receipt=payment_images_b64, 
+                cash_flow.save()
+                st.success("Amazon Payment Added with Success.")
+                st.experimental_rerun()
+
+        with st.form("import-amazon-settlements"):
+            st.header("**Import Amazon Settlements**")
+            settlement_files = st.file_uploader(
+                "Settlement Reports (Flat File V2)", 
+                type=["TXT", "TSV"], 
+                accept_multiple_files=True,
+            )
+            settlement_cost_per_unit = st.number_input(
+                "Cost per Unit Sold", 
+                min_value=0.0,
+                key="settlement-cost-per-unit",
+            )
+            import_settlements = st.form_submit_button("Submit")
+
+        if import_settlements and settlement_files:
+            settlements = pd.concat(
+                [read_settlements(settlement_file) for settlement_file in settlement_files],
+                ignore_index=True,
+            ).drop_duplicates(subset="Settlement ID")
+            number_imported = cash_flow.amazon_settlements(
+                settlements, 
+                cost_per_unit=settlement_cost_per_unit,
             )
-            cash_flow.dump(cash_flow.parsable_transactions())
-            st.success("Amazon Payment Added with Success.")
-            st.experimental_rerun()
+            cash_flow.save()
+            number_future = int((settlements["Deposit Date"] > date.today()).sum())
+            if number_future:
+                st.warning(
+                    f"{number_imported} Amazon Settlements Imported, "
+                    f"{number_future} not yet deposited were skipped."
+                )
+            else:
+                st.success(f"{number_imported} Amazon Settlements Imported with Success.")
+                st.experimental_rerun()
 
 
     viz = Visualizer(cash_flow)
@@ -158,8 +227,32 @@ def app():
     fig_profit, _ = viz.display_per_transaction_type(TransactionType.PROFIT)
     st.plotly_chart(fig_profit)
 
+    st.header("Profit & Loss")
+    pnl_period = st.radio("Period", options=["Month", "Quarter"], horizontal=True)
+    st.dataframe(cash_flow.pnl_table(pnl_period))
+    fig_pnl, _ = viz.display_pnl(pnl_period)
+    st.plotly_chart(fig_pnl)
+
     st.header("Transactions")
-    st.dataframe(cash_flow.dataframe())
+    col_start, col_end, col_type = st.columns(3)
+    # Every transaction is listed by default
+    transactions_start = col_start.date_input(
+        "From", 
+        value=cash_flow.first_date() or date.today(),
+    )
+    transactions_end = col_end.date_input("To", value=date.today())
+    transactions_type = col_type.selectbox(
+        "Type", 
+        options=[None] + list(TransactionType),
+        format_func=lambda t: "All" if t is None else t.name.capitalize(),
+    )
+    st.dataframe(
+        cash_flow.query(
+            start_date=transactions_start,
+            end_date=transactions_end,
+            transaction_type=transactions_type,
+        )
+    )
     st.header("Amazon Payments")
     st.dataframe(df_payments)
 
@@ -167,31 +260,66 @@ def app():
     with st.form("files-viz"):
         transaction_id_ = st.text_input("Transaction ID")
         id_submited = st.form_submit_button("Show")
-        
-    break_ = 0
-    if id_submited:
-        for x in cash_flow.transactions:
-            if x.id == int(transaction_id_):
-                break_ = 1
-                if x.file is not None:
-                    for y in x.file:
-                        st.image(base64_to_pil(y))
-                else:
-                    st.error("Transaction without documents.")
 
-                break
-            
-        if break_ == 0:
+    if id_submited:
+        try:
+            st.session_state["receipt-transaction-id"] = int(transaction_id_)
+        except ValueError:
             st.error("Transaction not detected.")
-                
-
-        
-
-
-
-
-        
-
 
+    # Gallery of the receipts of a month, only the thumbnails are loaded
+    df_files = cash_flow.query(with_file=True)
+    if len(df_files):
+        months = sorted(
+            {d.strftime("%Y-%m") for d in df_files["Date"]},
+            reverse=True,
+        )
+        col_month, col_page = st.columns(2)
+        month = col_month.selectbox("Month", options=months)
+        df_month = df_files[[d.strftime("%Y-%m") == month for d in df_files["Date"]]]
+        number_pages = max(int(np.ceil(len(df_month) / GALLERY_PAGE_SIZE)), 1)
+        page = col_page.number_input("Page", min_value=1, max_value=number_pages, step=1)
+        df_page = df_month.iloc[(page - 1) * GALLERY_PAGE_SIZE:page * GALLERY_PAGE_SIZE]
 
+        columns = st.columns(GALLERY_COLUMNS)
+        for i, (transaction_id, transaction_date, description) in enumerate(
+            zip(df_page["ID"], df_page["Date"], df_page["Description"])
+        ):
+            with columns[i % GALLERY_COLUMNS]:
+                transaction = cash_flow.get_transaction(transaction_id)
+                digest = transaction.file[0]
+                if cash_flow.receipts.processed(digest):
+                    st.image(
+                        receipt_thumbnails(cash_flow.receipts, digest)[0],
+                        caption=f"{transaction_date} - {description}",
+                    )
+                elif receipt_processor.has_failed(digest):
+                    st.warning("Receipt could not be read.")
+                    st.caption(f"{transaction_date} - {description}")
+                else:
+                    # Rendered by the workers, never in the page
+                    receipt_processor.schedule(digest)
+                    st.info("Processing receipt...")
+                    st.caption(f"{transaction_date} - {description}")
+                if st.button("Show", key=f"receipt-{transaction_id}"):
+                    st.session_state["receipt-transaction-id"] = transaction_id
 
+    # Full resolution receipts of the selected transaction
+    if "receipt-transaction-id" in st.session_state:
+        try:
+            transaction = cash_flow.get_transaction(st.session_state["receipt-transaction-id"])
+        except NoTransactionIDFound:
+            st.error("Transaction not detected.")
+        else:
+            st.subheader(f"{transaction.date} - {transaction.description}")
+            if transaction.file is not None:
+                # Receipts are only read from the store when shown
+                try:
+                    images = transaction.file_images(cash_flow.receipts)
+                except (InvalidReceipt, OSError):
+                    st.error("Receipt could not be read.")
+                else:
+                    for image in images:
+                        st.image(image)
+            else:
+                st.error("Transaction without documents.")
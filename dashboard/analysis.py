@@ -3,7 +3,7 @@ from dataclasses import dataclass
 from enum import Enum, auto
 import pandas as pd
 import numpy as np
-from typing import Optional, Union
+from typing import Dict, List, Optional, Union
 from products.utils import Product
 
 
@@ -104,6 +104,17 @@ class PPCAnalysis:
         return values
 
 
+def divide(numerator, denominator, default: float = np.nan) -> np.ndarray:
+    """
+    Elementwise division, the default where the denominator is zero
+    """
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    result = np.full(np.broadcast(numerator, denominator).shape, default)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+
 class DailyPerformancePPC:
     """
     Analyse the PPC daily performance
@@ -113,16 +124,48 @@ class DailyPerformancePPC:
         assert all(x.campaign==self.data[0].campaign for x in self.data[1:])
 
     def resume(self) -> pd.DataFrame:
-        values = {
-            key: []
-            for key in self.data[0].to_dict()
-        }
+        """
+        Metrics of PPCAnalysis.to_dict, one row per day. Each attribute is read
+        once into an array and each metric computed once for all the days; 
+        the metrics are NaN where PPCAnalysis has no value.
+        """
+        def column(attribute: str, dtype=float) -> np.ndarray:
+            return np.array([getattr(d, attribute) for d in self.data], dtype=dtype)
+
+        impressions = column("impressions", dtype=np.int64)
+        clicks = column("clicks", dtype=np.int64)
+        ppc_spend = column("ppc_spend")
+        ppc_orders = column("ppc_orders", dtype=np.int64)
+        ppc_sales = column("ppc_sales")
+
+        if all(isinstance(d.date, date) for d in self.data):
+            dates = pd.to_datetime([d.date for d in self.data])
+        else:
+            dates = [d.date.strftime("%Y-%m-%d") for d in self.data]
 
-        for d in self.data:
-            for k in values:
-                values[k].append(d.to_dict()[k])
+        df = pd.DataFrame(
+            {
+                "date": dates,
+                "impressions": impressions,
+                "impressions_share": column("impressions_share"),
+                "clicks": clicks,
+                "CTR": divide(clicks, impressions),
+                "ppc_spend": ppc_spend,
+                "ppc_orders": ppc_orders,
+                "ppc_sales": ppc_sales,
+                "CPC": column("CPC"),
+                "CR": divide(ppc_orders, clicks),
+                "ACOS": divide(ppc_spend, ppc_sales),
+            }
+        )
+
+        # All the days are of the same campaign
+        campaign = self.data[0].campaign
+        if campaign is not None:
+            for k_campaign, v_campaign in campaign.__dict__.items():
+                df[k_campaign] = [v_campaign] * len(df)
         
-        return pd.DataFrame(values)
+        return df
                 
 
 @dataclass
@@ -307,12 +350,152 @@ class PerformanceAnalysis:
         
         return d
 
-    
-    
 
+@dataclass
+class PerformanceBatch:
+    """
+    PerformanceAnalysis of many periods at once, one array per attribute
 
-    
-    
-    
+    Every metric of PerformanceAnalysis.to_dict is computed for all the periods
+    with a vectorized operation. The metrics are NaN (None in the records) where
+    PerformanceAnalysis returns None or fails with a division by zero.
+    """
+
+    date: np.ndarray
+    impressions: np.ndarray
+    impressions_share: np.ndarray
+    clicks: np.ndarray
+    CPC: np.ndarray
+    ppc_spend: np.ndarray
+    ppc_orders: np.ndarray
+    ppc_sales: np.ndarray
+    total_orders: np.ndarray
+    total_sales: np.ndarray
+    units_day_before: np.ndarray
+    sessions: np.ndarray
+    # Product values of each period
+    unit_price: np.ndarray
+    unit_exw_cost: np.ndarray
+    unit_package_cost: np.ndarray
+    unit_shipment_cost: np.ndarray
+    unit_fees: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.date)
 
+    @classmethod
+    def from_analyses(cls, analyses: List[PerformanceAnalysis]):
+        return cls.from_records([analysis.to_dict() for analysis in analyses])
 
+    @classmethod
+    def from_records(cls, records: List[dict]):
+        """
+        Batch of the records of PerformanceAnalysis.to_dict, as saved in the
+        performance data
+        """
+        def column(key: str, dtype=float) -> np.ndarray:
+            return np.array([record[key] for record in records], dtype=dtype)
+
+        total_orders = column("total_orders", dtype=int)
+        return cls(
+            date=column("date", dtype=object),
+            impressions=column("impressions", dtype=int),
+            impressions_share=column("impressions_share", dtype=object),
+            clicks=column("clicks", dtype=int),
+            CPC=column("CPC"),
+            ppc_spend=column("ppc_spend"),
+            ppc_orders=column("ppc_orders", dtype=int),
+            ppc_sales=column("ppc_sales"),
+            total_orders=total_orders,
+            total_sales=column("total_sales"),
+            units_day_before=column("current_units", dtype=int) + total_orders,
+            sessions=column("sessions", dtype=int),
+            unit_price=column("unit_price"),
+            unit_exw_cost=column("unit_exw_cost"),
+            unit_package_cost=column("unit_package_cost"),
+            unit_shipment_cost=column("unit_shipment_cost"),
+            unit_fees=column("unit_fees"),
+        )
+
+    def with_product(self, product: Product):
+        """
+        Same periods with the costs and fees of a product, the price of each
+        period is kept as it was sold at
+        """
+        values = dict(self.__dict__)
+        values["unit_exw_cost"] = np.full(len(self), product.exw_cost)
+        values["unit_package_cost"] = np.full(len(self), product.package.cost)
+        values["unit_shipment_cost"] = np.full(len(self), product.shipment_cost)
+        values["unit_fees"] = np.full(len(self), product.fees.total_fees)
+        return PerformanceBatch(**values)
+
+    def to_dict(self) -> Dict[str, np.ndarray]:
+        """
+        Every metric of PerformanceAnalysis.to_dict, one array per metric
+        """
+        unit_COG = self.unit_exw_cost + self.unit_package_cost + self.unit_shipment_cost
+        estimated_amazon_fees = self.total_orders * self.unit_fees
+        amazon_payment_without_ppc = self.total_sales - estimated_amazon_fees
+        profit_without_ppc = amazon_payment_without_ppc - self.total_orders * unit_COG
+        cost_of_conversion = (
+            divide(1.0, divide(self.total_orders, self.sessions), default=0.0)
+            * divide(self.ppc_spend, self.sessions)
+        )
+        unit_profit_without_ppc = divide(profit_without_ppc, self.total_orders, default=0.0)
+        unit_theoretical_profit = self.unit_price - unit_COG - self.unit_fees
+
+        return {
+            "date": self.date,
+            "impressions": self.impressions,
+            "impressions_share": self.impressions_share,
+            "clicks": self.clicks,
+            "CTR": divide(self.clicks, self.impressions),
+            "ppc_spend": self.ppc_spend,
+            "ppc_orders": self.ppc_orders,
+            "ppc_sales": self.ppc_sales,
+            "CPC": self.CPC,
+            "CR": divide(self.ppc_orders, self.clicks),
+            "ACOS": divide(self.ppc_spend, self.ppc_sales),
+            "total_orders": self.total_orders,
+            "total_sales": self.total_sales,
+            "ratio_ppc_sales": divide(self.ppc_sales, self.total_sales),
+            "sessions": self.sessions,
+            "cost_of_conversion": cost_of_conversion,
+            "TACOS": divide(self.ppc_spend, self.total_sales),
+            "current_units": self.units_day_before - self.total_orders,
+            "unit_price": self.unit_price,
+            "unit_exw_cost": self.unit_exw_cost,
+            "unit_package_cost": self.unit_package_cost,
+            "unit_shipment_cost": self.unit_shipment_cost,
+            "unit_COG": unit_COG,
+            "unit_fees": self.unit_fees,
+            "unit_theoretical_profit_without_ppc": unit_theoretical_profit,
+            "unit_profit_without_ppc": unit_profit_without_ppc,
+            "unit_profit_with_ppc": unit_profit_without_ppc - cost_of_conversion,
+            "amazon_payment_without_ppc": amazon_payment_without_ppc,
+            "amazon_payment_with_ppc": amazon_payment_without_ppc - self.ppc_spend,
+            "profit_without_ppc": profit_without_ppc,
+            "profit_with_ppc": profit_without_ppc - self.ppc_spend,
+            "theoretical_profit_margin": divide(unit_theoretical_profit, self.unit_price),
+            "profit_margin_without_ppc": divide(profit_without_ppc, self.total_sales, default=0.0),
+            "profit_margin_with_ppc": divide(
+                profit_without_ppc - self.ppc_spend, 
+                self.total_sales, 
+                default=0.0,
+            ),
+        }
+
+    def dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.to_dict())
+
+    def to_records(self) -> List[dict]:
+        """
+        Metrics of each period as PerformanceAnalysis.to_dict, with None for 
+        the missing values
+        """
+        return (
+            self.dataframe()
+            .astype(object)
+            .where(lambda df: df.notna(), None)
+            .to_dict(orient="records")
+        )
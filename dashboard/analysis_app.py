@@ -1,3 +1,5 @@
+import os
+import shutil
 import streamlit as st
 import pandas as pd
 from typing import List
@@ -7,12 +9,13 @@ from utils import (load_products,
                    dump_performance_data,
                    instantiate_product, 
                    product_display)
-from analysis import PPCAnalysis, PerformanceAnalysis, DateRange
+from analysis import PPCAnalysis, PerformanceAnalysis, PerformanceBatch, DateRange
 from products.utils import Product
 from reports_analyser import (BusinessReportAnalyser, 
                               CampaignReportAnalyser, 
                               DailyPerformanceReportAnalyser, 
                               Reports)
+from reports_warehouse import ReportsWarehouse
 
 
 def app():
@@ -58,6 +61,13 @@ def app():
     business_report = st.file_uploader("Upload Business Report", type=[".csv"])
     if business_report:
         BusinessReportAnalyser().show(business_report)
+        business_asin = st.text_input("ASIN", value="-")
+        if st.button("Save Business Report to Warehouse"):
+            n_rows = ReportsWarehouse().ingest_business_report(
+                BusinessReportAnalyser().read(business_report),
+                asin=business_asin,
+            )
+            st.success(f"{n_rows} days saved to the warehouse.")
 
     st.write("***")
 
@@ -71,28 +81,51 @@ def app():
     campaign_report = st.file_uploader("Upload Campaign Report", type=[".csv"])
     if campaign_report:
         CampaignReportAnalyser(tax=0.23).show(campaign_report)
+        if st.button("Save Campaign Report to Warehouse"):
+            n_rows = ReportsWarehouse().ingest_campaign_report(
+                CampaignReportAnalyser(tax=0.23).parse(campaign_report)
+            )
+            st.success(f"{n_rows} campaign days saved to the warehouse.")
 
     st.write("***")
 
     st.title("Daily Performance Analysis")
     st.subheader("Read Sales and Traffic Business Report")
-    with st.form("daily-reports"):
-        business_report_d = st.file_uploader("Upload Business Report", type=[".csv"])
-        campaign_report_d = st.file_uploader("Upload Campaign Report", type=[".csv"])
-        referal_fee_percentage = st.number_input("Referal Fee Percentage", min_value=0.0, value=0.15)
-        fba_fee = st.number_input("FBA Fee", min_value=0.0, value=7.33)
-        coupon_discount = st.number_input("Coupon Discount", min_value=0.0, value=0.05)
-        cog = st.number_input("Cost of Goods", min_value=0.0, value=13.62)
-        submit_daily_reports = st.form_submit_button("Submit")
-    
-    if submit_daily_reports:
-        DailyPerformanceReportAnalyser(
-            referal_fee_percentage=referal_fee_percentage,
-            fba_fee=fba_fee,
-            coupon_discount=coupon_discount,
-            cost_of_goods=cog,
-            tax=0.23,
-        ).show(Reports(business_report_d, campaign_report_d))
+    source = st.radio("Reports Source", options=["Upload", "Warehouse"], horizontal=True)
+    if source == "Warehouse":
+        warehouse = ReportsWarehouse()
+        warehouse_start_date, warehouse_end_date = warehouse.date_range()
+
+    if source == "Warehouse" and warehouse_start_date is None:
+        st.info("The warehouse has no days with both business and campaign data yet.")
+    else:
+        with st.form("daily-reports"):
+            if source == "Upload":
+                business_report_d = st.file_uploader("Upload Business Report", type=[".csv"])
+                campaign_report_d = st.file_uploader("Upload Campaign Report", type=[".csv"])
+            else:
+                st.write("- Warehouse Start Date: ", warehouse_start_date)
+                st.write("- Warehouse End Date: ", warehouse_end_date)
+                start_date_d = st.date_input("Start Date", value=warehouse_start_date)
+                end_date_d = st.date_input("End Date", value=warehouse_end_date)
+            referal_fee_percentage = st.number_input("Referal Fee Percentage", min_value=0.0, value=0.15)
+            fba_fee = st.number_input("FBA Fee", min_value=0.0, value=7.33)
+            coupon_discount = st.number_input("Coupon Discount", min_value=0.0, value=0.05)
+            cog = st.number_input("Cost of Goods", min_value=0.0, value=13.62)
+            submit_daily_reports = st.form_submit_button("Submit")
+
+        if submit_daily_reports:
+            daily_performance = DailyPerformanceReportAnalyser(
+                referal_fee_percentage=referal_fee_percentage,
+                fba_fee=fba_fee,
+                coupon_discount=coupon_discount,
+                cost_of_goods=cog,
+                tax=0.23,
+            )
+            if source == "Upload":
+                daily_performance.show(Reports(business_report_d, campaign_report_d))
+            else:
+                daily_performance.show_warehouse(warehouse, start_date_d, end_date_d)
 
 
     st.write("***")
@@ -151,6 +184,31 @@ def app():
     
     #st.write(st.session_state["performance_data"])
     st.subheader("Performance Data:")
+    if st.button("Recompute with Current Product Costs"):
+        # The metrics of every period are recomputed at once with the selected product
+        st.session_state["recomputed_performance_data"] = (
+            PerformanceBatch
+            .from_records(st.session_state["performance_data"])
+            .with_product(product)
+            .to_records()
+        )
+    if "recomputed_performance_data" in st.session_state:
+        # Nothing is saved until the recomputed data is reviewed and confirmed
+        st.info(
+            "Review the recomputed performance data. On save, the current data "
+            "is kept in performance_data_backup.json."
+        )
+        st.write(pd.DataFrame(st.session_state["recomputed_performance_data"]))
+        col_save, col_discard = st.columns(2)
+        if col_save.button("Save Recomputed Data"):
+            if os.path.exists("performance_data.json"):
+                shutil.copyfile("performance_data.json", "performance_data_backup.json")
+            st.session_state["performance_data"] = st.session_state.pop("recomputed_performance_data")
+            dump_performance_data(st.session_state["performance_data"], "performance_data.json")
+            st.experimental_rerun()
+        if col_discard.button("Discard"):
+            del st.session_state["recomputed_performance_data"]
+            st.experimental_rerun()
     df_performance = pd.DataFrame(st.session_state["performance_data"])
     df_performance["Conversion Rate"] = df_performance.eval("total_orders / sessions")
     st.write(df_performance)
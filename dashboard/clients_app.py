@@ -4,17 +4,15 @@ import json
 import plotly.figure_factory as ff
 import folium
 from streamlit_folium import st_folium
+from upload_cache import read_upload
 
-def app():
-    # Orders Report
-    report = st.file_uploader(
-        "Upload Fullfilment Report", 
-        type=[".txt"]
-    )
-    if report:
-        df_orders = pd.read_csv(report, sep="\t").query("`order-status` == 'Shipped'")
-        df_orders["COUNTER"] = 1
-        st.write(df_orders)
+
+class FulfillmentReportReader:
+    """
+    Read the shipped orders of the fulfillment report and locate them by FIPS code
+    """
+    def read(self, uploader) -> pd.DataFrame:
+        df_orders = pd.read_csv(uploader, sep="\t").query("`order-status` == 'Shipped'")
 
         df_fips = pd.read_csv(
             "fips2county.tsv", 
@@ -37,11 +35,23 @@ def app():
             
         df_orders["FIPS"] = df_orders.apply(find_fips, axis=1)
 
-        df_orders = df_orders.dropna(subset=['FIPS'])
-
         df_orders["COUNTER"] = 1
 
-    
+        return df_orders
+
+
+def app():
+    # Orders Report
+    report = st.file_uploader(
+        "Upload Fullfilment Report", 
+        type=[".txt"]
+    )
+    if report:
+        df_orders = read_upload(FulfillmentReportReader(), report)
+        st.write(df_orders)
+
+        df_orders = df_orders.dropna(subset=['FIPS'])
+
         # initialize the map and store it in a m object
         m = folium.Map(location=[40, -95], zoom_start=3)
 
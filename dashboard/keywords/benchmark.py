@@ -0,0 +1,109 @@
+"""
+Benchmark of the keywords repository storage
+
+Compares the single .json file read and written as Keyword objects, as the
+repository was before the parquet storage, with the directory of parquet
+segments: size on disk, full load (every snapshot read) and full save. The
+vectorized reader of the .json file (load_json) is shown for reference. Run it
+from the dashboard directory:
+    python -m keywords.benchmark keywords/repository.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from typing import List
+from keywords.classes import Keyword, KeywordsRepository
+
+
+def best_time(function, repeat: int) -> float:
+    """
+    Best wall time of a number of runs, in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def load_keyword_objects(path: str) -> List[List[Keyword]]:
+    """
+    Snapshots of a .json file as Keyword objects, the reader before the parquet storage
+    """
+    with open(path, "r") as f:
+        repository_values : List[dict] = json.load(f)
+
+    return [
+        [Keyword.from_row(row) for row in values["keywords"]]
+        for values in repository_values
+    ]
+
+
+def directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(path, name))
+        for name in os.listdir(path)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the keywords repository storage")
+    parser.add_argument("path", help="Path of a repository saved as a single .json file")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    repository = KeywordsRepository.load_json(args.path)
+    snapshots = load_keyword_objects(args.path)
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "repository.json")
+        partitions_path = os.path.join(directory, "repository")
+
+        def save_json():
+            values = [
+                {
+                    "tracking_date": keywords.date.isoformat(),
+                    "keywords": [keyword.into_row() for keyword in snapshot],
+                }
+                for keywords, snapshot in zip(repository.repository, snapshots)
+            ]
+            with open(json_path, "w") as f:
+                json.dump(values, f)
+
+        def save_partitions():
+            repository.partitions = {}
+            repository.path = None
+            shutil.rmtree(partitions_path, ignore_errors=True)
+            repository.save(partitions_path)
+
+        def load_json():
+            load_keyword_objects(json_path)
+
+        def load_json_vectorized():
+            KeywordsRepository.load_json(json_path)
+
+        def load_partitions():
+            KeywordsRepository.load(partitions_path).repository
+
+        results = {
+            "save": (best_time(save_json, args.repeat), best_time(save_partitions, args.repeat)),
+            "load": (best_time(load_json, args.repeat), best_time(load_partitions, args.repeat)),
+            "size": (os.path.getsize(json_path), directory_size(partitions_path)),
+        }
+        vectorized_load = best_time(load_json_vectorized, args.repeat)
+
+    print(f"{len(repository)} snapshots")
+    print(f"{'':6}{'json':>12}{'parquet':>12}{'speedup':>10}")
+    for name, (json_value, parquet_value) in results.items():
+        print(f"{name:6}{json_value:12.4g}{parquet_value:12.4g}{json_value / parquet_value:10.1f}x")
+    print(f"load of the .json file with load_json: {vectorized_load:.4g}")
+
+
+if __name__ == "__main__":
+    main()
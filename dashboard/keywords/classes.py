@@ -1,13 +1,39 @@
 from dataclasses import dataclass
 import pandas as pd
-from datetime import date
-from typing import Optional, List, Union 
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from datetime import date, timedelta
+from typing import Optional, List, Union, Dict
 from enum import Enum, auto
 import json
+import os
+import bisect
+import shutil
+import threading
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 
+
+# File of a repository directory listing the tracking dates and their partitions
+MANIFEST = "manifest.json"
+MANIFEST_BACKUP = "manifest_backup.json"
+# Compression of the parquet segments, snappy decodes about twice as fast as
+# zstd for files only slightly larger
+SEGMENT_COMPRESSION = "snappy"
+
+
+def write_json(path: str, values):
+    """
+    Write a .json file atomically, it is either fully written or left untouched
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(values, f)
+    os.replace(temporary_path, path)
+
     
 class SVClassification(Enum):
     HIGH = auto()
@@ -168,80 +194,505 @@ class Keyword:
         }
 
 
+# Dataframe columns of a Keywords snapshot
+KEYWORDS_COLUMNS = [
+    "ASIN",
+    "Keyword",
+    "Search Volume",
+    "CPR",
+    "Competing Products",
+    "Organic Rank",
+    "Average Rank",
+    "Sponsored Position",
+    "Position",
+    "Ranking Competitors",
+    "Search Volume Classification",
+    "Organic Rank Classification",
+    "Campaign Structure",
+    "Campaign Objective",
+    "Search Query",
+    "Search Query Score",
+    "Search Query Volume",
+    "Impressions: Total Count",
+    "Impressions: ASIN Count",
+    "Clicks: Total Count",
+    "Clicks: ASIN Count",
+    "Cart Adds: Total Count",
+    "Cart Adds: ASIN Count",
+    "Purchases: Total Count",
+    "Purchases: ASIN Count",
+    "Search Query CVR (%)",
+    "ASIN CVR (%)",
+]
+
+# Numeric columns, missing values ('-') are stored as NaN
+NUMERIC_COLUMNS = [
+    "Search Volume",
+    "CPR",
+    "Organic Rank",
+    "Average Rank",
+    "Sponsored Position",
+    "Position",
+    "Ranking Competitors",
+    "Search Query Score",
+    "Search Query Volume",
+    "Impressions: Total Count",
+    "Impressions: ASIN Count",
+    "Clicks: Total Count",
+    "Clicks: ASIN Count",
+    "Cart Adds: Total Count",
+    "Cart Adds: ASIN Count",
+    "Purchases: Total Count",
+    "Purchases: ASIN Count",
+    "Search Query CVR (%)",
+    "ASIN CVR (%)",
+]
+
+# Text columns, dictionary encoded in the partitions with missing values ('-') as nulls
+CATEGORICAL_COLUMNS = [
+    column
+    for column in KEYWORDS_COLUMNS
+    if column not in NUMERIC_COLUMNS
+]
+
+# Columns of the partitions, numeric values as floats and text as strings
+PARTITION_SCHEMA = pa.schema(
+    [
+        (column, pa.float64() if column in NUMERIC_COLUMNS else pa.string())
+        for column in KEYWORDS_COLUMNS
+    ]
+)
+
+# Label of each enum member name, e.g. "PREMIUM" -> "Premium"
+ENUM_LABELS = {
+    "Search Volume Classification": {
+        member.name: member.name.capitalize() 
+        for member in SVClassification
+    },
+    "Organic Rank Classification": {
+        member.name: member.name.capitalize()
+        for member in OrganicRankClassification
+    },
+}
+
+
 class Keywords:
-    def __init__(self, tracking_date: date, keywords: List[Keyword]):
+    """
+    Keywords tracked at a date, stored as typed dataframe columns
+    """
+    def __init__(self, tracking_date: date, df: pd.DataFrame):
         self.date = tracking_date
-        self.keywords = keywords
+        self.df = df
 
     @classmethod
     def from_dataframe(cls, tracking_date: date, df: pd.DataFrame):
-        keywords : List[Keyword] = [
-            Keyword.from_row(row)
-            for _, row in df.iterrows()
-        ]
+        df = df[KEYWORDS_COLUMNS].reset_index(drop=True)
+        for column in NUMERIC_COLUMNS:
+            df[column] = pd.to_numeric(df[column], errors="coerce")
+        for column, labels in ENUM_LABELS.items():
+            df[column] = df[column].astype(str).str.upper().map(labels).fillna(df[column])
 
         return cls(
             tracking_date=tracking_date,
-            keywords=keywords,
+            df=df,
+        )
+
+    @classmethod
+    def from_keywords(cls, tracking_date: date, keywords: List[Keyword]):
+        return cls.from_dataframe(
+            tracking_date=tracking_date,
+            df=pd.DataFrame(
+                [keyword.into_row() for keyword in keywords],
+                columns=KEYWORDS_COLUMNS,
+            ),
         )
     
     @classmethod
-    def from_dict(cls, values: dict):
+    def from_columns(cls, tracking_date: date, columns: Dict[str, list]):
+        return cls.from_dataframe(
+            tracking_date=tracking_date,
+            df=pd.DataFrame(columns),
+        )
+
+    @staticmethod
+    def dataframe_table(df: pd.DataFrame) -> pa.Table:
+        """
+        Keywords dataframe as an arrow table of PARTITION_SCHEMA, where the '-'
+        of the text columns are nulls. Parquet dictionary encodes the text
+        columns and stores the nulls as bitmaps.
+        """
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        columns = []
+        for field in PARTITION_SCHEMA:
+            column = table.column(field.name).cast(field.type)
+            if field.name in CATEGORICAL_COLUMNS:
+                column = pc.if_else(pc.equal(column, "-"), pa.scalar(None, pa.string()), column)
+            columns.append(column)
+
+        return pa.Table.from_arrays(columns, schema=PARTITION_SCHEMA)
+
+    @staticmethod
+    def table_dataframe(table: pa.Table) -> pd.DataFrame:
+        """
+        Keywords dataframe of a table written by dataframe_table, the nulls of
+        the text columns are read back as '-'
+        """
+        for column in CATEGORICAL_COLUMNS:
+            index = table.schema.get_field_index(column)
+            values = table.column(index)
+            if values.type != pa.string():
+                # Partitions first written as categoricals are dictionary arrays
+                values = values.cast(pa.string())
+            table = table.set_column(index, column, pc.fill_null(values, "-"))
+
+        return table.to_pandas()
+
+    @classmethod
+    def from_table(cls, tracking_date: date, table: pa.Table):
         return cls(
+            tracking_date=tracking_date,
+            df=cls.table_dataframe(table),
+        )
+
+    @classmethod
+    def read_partition(cls, tracking_date: date, path: str):
+        """
+        Read keywords saved in a parquet file of their own, or as columns in a .json file
+        """
+        if path.endswith(".json"):
+            with open(path, "r") as f:
+                return cls.from_columns(tracking_date, json.load(f))
+
+        return cls.from_table(tracking_date, pq.read_table(path))
+
+    @classmethod
+    def from_dict(cls, values: dict):
+        return cls.from_dataframe(
             tracking_date=date.fromisoformat(values["tracking_date"]),
-            keywords=[
-                Keyword.from_row(k) 
-                for k in values["keywords"]
-            ],
+            df=pd.DataFrame(values["keywords"], columns=KEYWORDS_COLUMNS),
         )
     
     def __len__(self) -> int:
         """Number of keywords tracked"""
 
-        return len([k for k in self.keywords if k.name != '-'])
+        return int((self.df["Keyword"] != '-').sum())
+
+    @property
+    def keywords(self) -> List[Keyword]:
+        return [
+            Keyword.from_row(row)
+            for row in self.df.to_dict(orient="records")
+        ]
     
     def dataframe(self) -> pd.DataFrame:
-        return pd.DataFrame(
-            [
-                keyword.into_row()
-                for keyword in self.keywords
-            ]
-        )
+        return self.df.copy()
     
     def keyword_tracker(self) -> pd.DataFrame:
-        df = self.dataframe()
-        df = df.query("Keyword != '-'")
+        df = self.df[self.df["Keyword"] != '-'].reset_index(drop=True)
         df["Date"] = self.date
         df["COUNTER"] = 1
         df["Search Volume"] = df["Search Volume"].astype(int)
-        df_sum = df.groupby("Date").sum().reset_index()[["Date", "COUNTER", "Search Volume"]]
-        df_sum = df_sum.rename(
-            columns={
-                "COUNTER":"TOTAL_KEYWORDS",
-                "Search Volume": "TOTAL_SEARCH_VOLUME",
-            }
-        )
-        df = pd.merge(df, df_sum, how='inner', on="Date")
+        df["TOTAL_KEYWORDS"] = len(df)
+        df["TOTAL_SEARCH_VOLUME"] = df["Search Volume"].sum()
 
         return df
     
     def dict(self) -> dict:
         return {
             "tracking_date": self.date.isoformat(),
-            "keywords": [
-                keyword.into_row()
-                for keyword in self.keywords
-            ]
+            "keywords": self.df.astype(object).where(
+                self.df.notna(), 
+                "-",
+            ).to_dict(orient="records"),
         }
     
 
+# Metrics kept as keyword x tracking date matrices
+MATRIX_METRICS = [
+    "Organic Rank",
+    "Sponsored Position",
+    "Search Volume",
+    "CPR",
+    "Search Query Volume",
+]
+
+# Metrics where 0 means the keyword is not ranked
+RANK_METRICS = [
+    "Organic Rank",
+    "Sponsored Position",
+]
+
+
+class KeywordMatrices:
+    """
+    Dense keyword x tracking date matrices of the keyword tracker history.
+    Keywords are matched case insensitively and a NaN means the keyword 
+    was not tracked at that date.
+    """
+    def __init__(self, history: pd.DataFrame, metrics: List[str] = MATRIX_METRICS):
+        keyword_codes, keywords = pd.factorize(history["Keyword"].str.lower())
+        date_codes, dates = pd.factorize(history["Date"], sort=True)
+        _, first_rows = np.unique(keyword_codes, return_index=True)
+
+        self.keywords = np.asarray(keywords, dtype=object)
+        # Keyword name as first tracked
+        self.names = history["Keyword"].to_numpy()[first_rows]
+        self.dates = list(dates)
+        # Row of each lowercase keyword
+        self.index : Dict[str, int] = {
+            keyword: row 
+            for row, keyword in enumerate(self.keywords)
+        }
+        self.values : Dict[str, np.ndarray] = {}
+        for metric in metrics:
+            matrix = np.full((len(self.keywords), len(self.dates)), np.nan)
+            matrix[keyword_codes, date_codes] = history[metric].to_numpy(dtype=float)
+            self.values[metric] = matrix
+
+        # Organic rank classification codes, -1 when the keyword was not tracked
+        classification_codes, classifications = pd.factorize(
+            history["Organic Rank Classification"]
+        )
+        self.classifications = np.asarray(classifications, dtype=object)
+        self.classification = np.full((len(self.keywords), len(self.dates)), -1)
+        self.classification[keyword_codes, date_codes] = classification_codes
+
+    def rows(self, keywords: List[str]) -> np.ndarray:
+        return np.array(
+            [self.index[k.lower()] for k in keywords if k.lower() in self.index],
+            dtype=int,
+        )
+    
+    def matrix(self, metric: str) -> np.ndarray:
+        """
+        Matrix of a metric, unranked positions (0) are NaN for the rank metrics
+        """
+        matrix = self.values[metric]
+        if metric in RANK_METRICS:
+            matrix = np.where(matrix == 0, np.nan, matrix)
+
+        return matrix
+
+    def evolution(self, keywords: List[str], metric: str) -> pd.DataFrame:
+        """
+        Values of a metric over time for a set of keywords
+        """
+        rows = self.rows(keywords)
+        df = pd.DataFrame(
+            {
+                "Date": np.tile(np.asarray(self.dates, dtype=object), len(rows)),
+                "Keyword": np.repeat(self.names[rows], len(self.dates)),
+                metric: self.values[metric][rows].ravel(),
+            }
+        )
+
+        return df.dropna(subset=[metric])
+
+    def velocity(self, metric: str = "Organic Rank") -> pd.DataFrame:
+        """
+        Change per day of a metric between consecutive tracking dates
+        """
+        days = np.array([d.toordinal() for d in self.dates])
+        velocity = np.diff(self.matrix(metric), axis=1) / np.diff(days)
+
+        return pd.DataFrame(velocity, index=self.names, columns=self.dates[1:])
+
+    def movers(self, metric: str = "Organic Rank", days: int = 7) -> pd.DataFrame:
+        """
+        Change of a metric between the last tracking date and the last tracking
+        date at least a number of days before, sorted by change
+        """
+        latest = len(self.dates) - 1
+        previous_dates = [d for d in self.dates if d <= self.dates[latest] - timedelta(days=days)]
+        previous = len(previous_dates) - 1 if previous_dates else max(latest - 1, 0)
+
+        matrix = self.matrix(metric)
+        df = pd.DataFrame(
+            {
+                "Keyword": self.names,
+                "Search Volume": self.values["Search Volume"][:, latest],
+                f"{metric} {self.dates[previous]}": matrix[:, previous],
+                f"{metric} {self.dates[latest]}": matrix[:, latest],
+                "Change": matrix[:, latest] - matrix[:, previous],
+            }
+        )
+
+        return df.dropna(subset=["Change"]).sort_values("Change", ascending=True)
+
+    def movements(self, from_columns: np.ndarray, to_columns: np.ndarray) -> pd.DataFrame:
+        """
+        Organic rank movements of every keyword tracked in both dates of each 
+        pair of date columns. A negative delta is a rank gain and the impact is 
+        the rank gain weighted by search volume.
+        """
+        rank = self.matrix("Organic Rank")
+        rank_from = rank[:, from_columns]
+        rank_to = rank[:, to_columns]
+        classification_from = self.classification[:, from_columns]
+        classification_to = self.classification[:, to_columns]
+        search_volume = self.values["Search Volume"][:, to_columns]
+
+        rows, pairs = np.nonzero((classification_from >= 0) & (classification_to >= 0))
+        delta = (rank_to - rank_from)[rows, pairs]
+        dates = np.asarray(self.dates, dtype=object)
+
+        df = pd.DataFrame(
+            {
+                "Keyword": self.names[rows],
+                "From Date": dates[from_columns][pairs],
+                "To Date": dates[to_columns][pairs],
+                "Organic Rank From": rank_from[rows, pairs],
+                "Organic Rank To": rank_to[rows, pairs],
+                "Rank Delta": delta,
+                "Classification From": self.classifications[classification_from[rows, pairs]],
+                "Classification To": self.classifications[classification_to[rows, pairs]],
+                "Search Volume": search_volume[rows, pairs],
+                "Impact": -delta * search_volume[rows, pairs],
+            }
+        )
+        df["Transition"] = (df["Classification From"] + "→" + df["Classification To"]).where(
+            df["Classification From"] != df["Classification To"],
+            "-",
+        )
+
+        return df
+
+    def search_volume_reconciliation(self) -> pd.DataFrame:
+        """
+        Helium10 search volume vs SQP search query volume of every keyword and
+        tracking date with both volumes. The ratio is SQP / H10 and the drift
+        is the change (%) of the ratio since the first date of the keyword.
+        """
+        h10 = self.values["Search Volume"]
+        sqp = self.values["Search Query Volume"]
+        ratio = np.where((h10 > 0) & (sqp > 0), sqp / np.where(h10 > 0, h10, 1), np.nan)
+
+        reconciled = ~np.isnan(ratio)
+        first_ratio = ratio[np.arange(len(ratio)), np.argmax(reconciled, axis=1)]
+        drift = (ratio / first_ratio[:, None] - 1) * 100
+
+        rows, columns = np.nonzero(reconciled)
+        dates = np.asarray(self.dates, dtype=object)
+
+        return pd.DataFrame(
+            {
+                "Keyword": self.names[rows],
+                "Date": dates[columns],
+                "H10 Search Volume": h10[rows, columns],
+                "SQP Search Volume": sqp[rows, columns],
+                "Ratio": ratio[rows, columns],
+                "Drift (%)": drift[rows, columns],
+            }
+        )
+
+
+# Maximum number of keywords returned by a search
+SEARCH_LIMIT = 50
+
+
+class KeywordSearchIndex:
+    """
+    Search of the keywords ever tracked by prefix or substring, case insensitive.
+    Results are sorted by the highest search volume of the keyword.
+    """
+    def __init__(self, names: np.ndarray, search_volume: np.ndarray):
+        # Keywords from the highest to the lowest search volume
+        order = np.argsort(-np.nan_to_num(search_volume, nan=-1), kind="stable")
+        self.names : np.ndarray = np.asarray(names, dtype=object)[order]
+        self.lower = pd.Series(self.names, dtype=object).str.lower()
+        # Lowercase keywords in alphabetical order and their search volume rank
+        self.sorted_positions : np.ndarray = np.argsort(self.lower.to_numpy(), kind="stable")
+        self.sorted_lower : List[str] = list(self.lower.to_numpy()[self.sorted_positions])
+
+    @classmethod
+    def from_matrices(cls, matrices: KeywordMatrices):
+        search_volume = matrices.values["Search Volume"]
+        return cls(
+            matrices.names,
+            np.nanmax(search_volume, axis=1) if search_volume.size else np.array([]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def prefix(self, query: str) -> np.ndarray:
+        """
+        Search volume rank of the keywords starting with the query
+        """
+        start = bisect.bisect_left(self.sorted_lower, query)
+        end = bisect.bisect_left(self.sorted_lower, query + "\uffff")
+
+        return np.sort(self.sorted_positions[start:end])
+
+    def search(self, query: str, limit: int = SEARCH_LIMIT) -> List[str]:
+        """
+        Keywords starting with the query followed by the keywords containing it
+        """
+        query = query.strip().lower()
+        if not query:
+            return list(self.names[:limit])
+
+        positions = self.prefix(query)[:limit]
+        if len(positions) < limit:
+            contains = np.flatnonzero(self.lower.str.contains(query, regex=False).to_numpy())
+            contains = contains[~np.isin(contains, positions)]
+            positions = np.concatenate([positions, contains[:limit - len(positions)]])
+
+        return list(self.names[positions])
+
+
 class KeywordsRepository:
+    """
+    Keywords tracked over time
+
+    The repository is stored in a directory of parquet segments and a manifest
+    listing the partition of each tracking date: a segment is written per save,
+    with one row group per tracking date, and compact merges the segments into
+    one. Loading a repository only reads the manifest, the partitions are read
+    when the snapshots are first needed, a whole segment at once.
+    """
     def __init__(self, repository: List[Keywords]):
-        self.repository = sorted(repository, key=lambda x: x.date)
-        self.tracking_dates = [keywords.date for keywords in self.repository]
+        self.path : Optional[str] = None
+        # Manifest entry of each saved tracking date
+        self.partitions : Dict[date, dict] = {}
+        # Snapshot of each tracking date, None until it is read from the partition
+        self.snapshots : Dict[date, Optional[Keywords]] = {
+            keywords.date: keywords
+            for keywords in repository
+        }
+        self.tracking_dates = sorted(self.snapshots)
+        # Keyword tracker history of all the snapshots, built when first needed
+        self._history : Optional[pd.DataFrame] = None
+        self._matrices : Optional[KeywordMatrices] = None
+        self._search_index : Optional[KeywordSearchIndex] = None
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, MANIFEST))
 
     @classmethod
-    def load(cls, path: str):
+    def load(cls, path: str, manifest: str = MANIFEST):
+        """
+        Load a repository directory, optionally from a backup of the manifest
+        """
+        with open(os.path.join(path, manifest), "r") as f:
+            values : dict = json.load(f)
+
+        repository = cls([])
+        repository.path = path
+        for partition in values["partitions"]:
+            tracking_date = date.fromisoformat(partition["tracking_date"])
+            repository.partitions[tracking_date] = partition
+            repository.snapshots[tracking_date] = None
+        repository.tracking_dates = sorted(repository.snapshots)
+
+        return repository
+
+    @classmethod
+    def load_json(cls, path: str):
+        """
+        Load a repository saved as a single .json file
+        """
         with open(path, "r") as f:
             repository_values : List[dict] = json.load(f)
         
@@ -253,31 +704,253 @@ class KeywordsRepository:
         return cls(repository)
     
     def __len__(self) -> int:
-        return len(self.repository)
+        return len(self.tracking_dates)
+
+    def snapshot(self, tracking_date: date) -> Keywords:
+        """
+        Keywords tracked at a date, read from its partition if needed
+        """
+        keywords = self.snapshots[tracking_date]
+        if keywords is None:
+            partition = self.partitions[tracking_date]
+            path = os.path.join(self.path, partition["file"])
+            if "row_group" in partition:
+                keywords = Keywords.from_table(
+                    tracking_date,
+                    pq.ParquetFile(path).read_row_group(partition["row_group"]),
+                )
+            else:
+                keywords = Keywords.read_partition(tracking_date, path)
+            self.snapshots[tracking_date] = keywords
+
+        return keywords
+
+    def read_segments(self):
+        """
+        Read the snapshots not read yet, each segment with a single read
+        """
+        segments : Dict[str, List[date]] = {}
+        for tracking_date in self.tracking_dates:
+            partition = self.partitions.get(tracking_date, {})
+            if self.snapshots[tracking_date] is None and "row_group" in partition:
+                segments.setdefault(partition["file"], []).append(tracking_date)
+
+        for file, tracking_dates in segments.items():
+            segment = pq.ParquetFile(os.path.join(self.path, file))
+            offsets = np.cumsum([0] + [
+                segment.metadata.row_group(i).num_rows
+                for i in range(segment.metadata.num_row_groups)
+            ])
+            df = Keywords.table_dataframe(segment.read(use_threads=False))
+            for tracking_date in tracking_dates:
+                row_group = self.partitions[tracking_date]["row_group"]
+                self.snapshots[tracking_date] = Keywords(
+                    tracking_date=tracking_date,
+                    df=df.iloc[offsets[row_group]:offsets[row_group + 1]].reset_index(drop=True),
+                )
+
+    def copy(self):
+        """
+        New version of the repository sharing the snapshots and the derived frames,
+        which are never modified in place, so adding to the copy leaves this one unchanged
+        """
+        repository = KeywordsRepository([])
+        repository.path = self.path
+        repository.partitions = dict(self.partitions)
+        repository.snapshots = dict(self.snapshots)
+        repository.tracking_dates = list(self.tracking_dates)
+        repository._history = self._history
+        repository._matrices = self._matrices
+        repository._search_index = self._search_index
+
+        return repository
+
+    @property
+    def repository(self) -> List[Keywords]:
+        self.read_segments()
+        return [
+            self.snapshot(tracking_date)
+            for tracking_date in self.tracking_dates
+        ]
     
     def add(self, keywords: Keywords):
-        if keywords.date not in self.tracking_dates:
-            self.repository.append(keywords)
-            self.__init__(self.repository)
+        if keywords.date in self.snapshots:
+            return None
+
+        index = bisect.bisect(self.tracking_dates, keywords.date)
+        self.tracking_dates.insert(index, keywords.date)
+        self.snapshots[keywords.date] = keywords
+        self._matrices = None
+        self._search_index = None
+
+        # Extend the history with the new snapshot instead of rebuilding it
+        if self._history is not None:
+            history = pd.concat(
+                [self._history, keywords.keyword_tracker()],
+                ignore_index=True,
+            )
+            if index != len(self.tracking_dates) - 1:
+                history = history.sort_values("Date", kind="stable", ignore_index=True)
+            self._history = history
         
     def serialize(self) -> List[dict]:
         return [
             k.dict()
             for k in self.repository
         ]
+
+    def manifest(self) -> dict:
+        return {
+            "partitions": [
+                self.partitions[tracking_date]
+                for tracking_date in self.tracking_dates
+            ]
+        }
     
-    def save(self, path: str):
-        with open(path, "w") as f:
-            json.dump(self.serialize(), f)
+    def save(self, path: Optional[str] = None):
+        """
+        Save the repository into a directory. Segments are never rewritten, so
+        saving into the directory the repository was loaded from only writes a
+        segment with the new tracking dates and the manifest.
+        """
+        path = path or self.path
+        if path != self.path:
+            # Every snapshot has to be written into a new directory
+            self.read_segments()
+            for tracking_date in self.tracking_dates:
+                self.snapshot(tracking_date)
+            self.partitions = {}
+
+        os.makedirs(path, exist_ok=True)
+        tracking_dates = [
+            tracking_date
+            for tracking_date in self.tracking_dates
+            if tracking_date not in self.partitions
+        ]
+        if tracking_dates:
+            file = self.segment_file(path)
+            segment_path = os.path.join(path, file)
+            # The snapshots are converted at once and written a row group each
+            snapshots = [self.snapshots[tracking_date] for tracking_date in tracking_dates]
+            table = Keywords.dataframe_table(
+                pd.concat([keywords.df for keywords in snapshots], ignore_index=True)
+            )
+            offset = 0
+            # Row groups are read by position, the column statistics are not needed
+            with pq.ParquetWriter(
+                    f"{segment_path}.tmp",
+                    PARTITION_SCHEMA,
+                    compression=SEGMENT_COMPRESSION,
+                    write_statistics=False,
+            ) as writer:
+                for row_group, keywords in enumerate(snapshots):
+                    writer.write_table(
+                        table.slice(offset, len(keywords.df)),
+                        row_group_size=max(len(keywords.df), 1),
+                    )
+                    offset += len(keywords.df)
+                    self.partitions[keywords.date] = {
+                        "tracking_date": keywords.date.isoformat(),
+                        "file": file,
+                        "row_group": row_group,
+                        "keywords": len(keywords),
+                    }
+            os.replace(f"{segment_path}.tmp", segment_path)
+
+        write_json(os.path.join(path, MANIFEST), self.manifest())
+        self.path = path
+
+    @staticmethod
+    def segment_file(path: str) -> str:
+        """
+        Name of the next segment of a directory, never used before
+        """
+        numbers = [
+            int(name[len("segment-"):-len(".parquet")])
+            for name in os.listdir(path)
+            if name.startswith("segment-") and name.endswith(".parquet")
+        ]
+
+        return f"segment-{max(numbers, default=0) + 1:05d}.parquet"
+
+    def compact(self):
+        """
+        Rewrite the partitions in a single segment when they are spread over
+        several files, e.g. one segment per added tracking date or partitions
+        saved as .json columns. The old files are kept, as backups of the
+        manifest may still use them.
+        """
+        files = {partition["file"] for partition in self.partitions.values()}
+        if len(files) <= 1:
+            return None
+
+        self.read_segments()
+        for tracking_date in self.tracking_dates:
+            self.snapshot(tracking_date)
+        self.partitions = {}
+
+        self.save()
+
+    def backup(self, manifest: str = MANIFEST_BACKUP):
+        """
+        Backup of the saved repository. As partitions are never rewritten, a copy
+        of the manifest is enough to restore the repository with load.
+        """
+        shutil.copyfile(
+            os.path.join(self.path, MANIFEST),
+            os.path.join(self.path, manifest),
+        )
     
     def keyword_tracker_history(self) -> pd.DataFrame:
-        keyword_tracker = pd.concat(
-            [rep.keyword_tracker() for rep in self.repository],
-            ignore_index=True,
-        )
+        """
+        Keyword tracker of all the tracking dates. The dataframe is built once and 
+        shared by every caller, so it must not be modified in place.
+        """
+        if self._history is None:
+            self._history = pd.concat(
+                [rep.keyword_tracker() for rep in self.repository],
+                ignore_index=True,
+            )
+
+        return self._history
 
-        return keyword_tracker
+    def matrices(self) -> KeywordMatrices:
+        """
+        Keyword x tracking date matrices, built once per repository version
+        """
+        if self._matrices is None:
+            self._matrices = KeywordMatrices(self.keyword_tracker_history())
+
+        return self._matrices
+
+    def search_index(self) -> KeywordSearchIndex:
+        """
+        Search index of the keywords ever tracked, built once per repository version
+        """
+        if self._search_index is None:
+            self._search_index = KeywordSearchIndex.from_matrices(self.matrices())
+
+        return self._search_index
     
+    def rank_movements(
+            self, 
+            from_date: Optional[date] = None, 
+            to_date: Optional[date] = None,
+    ) -> pd.DataFrame:
+        """
+        Organic rank movements between two tracking dates or, when no dates are
+        given, between every pair of consecutive tracking dates
+        """
+        matrices = self.matrices()
+        if from_date is not None and to_date is not None:
+            from_columns = np.array([matrices.dates.index(from_date)])
+            to_columns = np.array([matrices.dates.index(to_date)])
+        else:
+            from_columns = np.arange(len(matrices.dates) - 1)
+            to_columns = from_columns + 1
+
+        return matrices.movements(from_columns, to_columns)
+
     def total_search_volume_viz(self):
         """
         Percentage of keywords per organic rank classification
@@ -382,9 +1055,7 @@ class KeywordsRepository:
         """
         Rank evolution for a set of keywords
         """
-        df = self.keyword_tracker_history()
-        df["INCLUDE"] = df["Keyword"].apply(lambda x: x.lower() in (k.lower() for k in keywords))
-        df = df.query("INCLUDE == True")
+        df = self.matrices().evolution(keywords, metric)
 
         fig = px.line(
             df, 
@@ -440,28 +1111,73 @@ class KeywordsRepository:
         fig.update_yaxes(title_text="Conversion Rate (%)")
 
         return fig
-    
-    
-    # Evolution in rank for each keyword tracked
-    # Plot H10 search volume vs SQP search volume
-        
-
-
-
-
-    
-         
-
-
-
-
 
+    def search_volume_reconciliation_viz(
+            self, 
+            keywords: Optional[List[str]] = None, 
+            top: int = 20,
+    ):
+        """
+        Small multiples of the SQP / H10 search volume ratio over time, for a set
+        of keywords or the top keywords by H10 search volume
+        """
+        df = self.matrices().search_volume_reconciliation()
+        if keywords:
+            keywords = [k.lower() for k in keywords]
+            df = df[df["Keyword"].str.lower().isin(keywords)]
+        else:
+            top_keywords = df.groupby("Keyword")["H10 Search Volume"].max().nlargest(top).index
+            df = df[df["Keyword"].isin(top_keywords)]
 
+        fig = px.line(
+            df,
+            x="Date",
+            y="Ratio",
+            facet_col="Keyword",
+            facet_col_wrap=4,
+            hover_data=["H10 Search Volume", "SQP Search Volume", "Drift (%)"],
+            markers=True,
+        )
+        fig.add_hline(y=1, line_dash="dot", line_color="grey")
+        fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+        fig.update_layout(
+            title="SQP / H10 Search Volume Ratio",
+            height=250 * max(int(np.ceil(df["Keyword"].nunique() / 4)), 1),
+        )
 
+        return fig
 
-    
 
+class SharedKeywordsRepository:
+    """
+    Keywords repository shared by every session of the process
 
-         
+    Readers get the current version, which is never modified. A writer adds a
+    tracking date to a copy, saves it and then publishes it as the new version,
+    so readers always see a consistent repository and its derived frames
+    (history, matrices and search index) are built once for all sessions.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.version = 0
+        self._repository = KeywordsRepository.load(path)
+        # Segments written by the previous runs are merged into one
+        self._repository.compact()
 
+    def current(self) -> KeywordsRepository:
+        return self._repository
 
+    def add(self, keywords: Keywords) -> KeywordsRepository:
+        """
+        Add and save a tracking date, returns the new version
+        """
+        with self.lock:
+            repository = self._repository.copy()
+            repository.backup()
+            repository.add(keywords)
+            repository.save()
+            self._repository = repository
+            self.version += 1
+
+        return repository
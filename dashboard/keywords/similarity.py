@@ -0,0 +1,374 @@
+"""
+Similarity of keyword phrases
+
+Phrases are represented as sparse TF-IDF vectors of their words and word
+character n-grams, after lowercasing and removing plurals, so word order and
+plural variants of a phrase have the same vector. The vectors are stored as
+long (phrase, term, weight) dataframes, compressed into sparse rows to
+compute in bulk the cosine similarity of two sets of phrases.
+"""
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Union
+from keywords.classes import CampaignStructure
+
+
+Phrases = Union[List[str], pd.Series]
+
+# Approximate number of candidate pairs compared at once
+MAX_CANDIDATES = 2_000_000
+
+# Maximum number of keywords of a campaign of each structure, All KW has no limit
+CAMPAIGN_SIZES = {
+    CampaignStructure.SingleKeyword.value: 1,
+    CampaignStructure.FiveKeywords.value: 5,
+    CampaignStructure.TenKeywords.value: 10,
+}
+
+
+def tokenize(phrases: Phrases) -> pd.Series:
+    """
+    Lowercase words of each phrase without plurals
+    """
+    return (
+        pd.Series(phrases, dtype=object)
+        .reset_index(drop=True)
+        .astype(str)
+        .str.lower()
+        .str.replace(r"[^a-z0-9]+", " ", regex=True)
+        .str.replace(r"(ss|x|ch|sh)es\b", r"\1", regex=True)
+        .str.replace(r"(?<=[a-z]{2})(?<![su])s\b", "", regex=True)
+        .str.split()
+    )
+
+
+def word_terms(word: str, n: int = 3) -> List[str]:
+    """
+    Terms of a word: the word itself and its character n-grams
+    """
+    padded = f"#{word}#"
+    return [f"w:{word}"] + [
+        padded[i:i + n]
+        for i in range(max(len(padded) - n + 1, 1))
+    ]
+
+
+class PhraseVectorizer:
+    """
+    TF-IDF vectors of phrases as long dataframes with the columns phrase,
+    term and weight, where phrase is the position of the phrase
+    """
+    def fit(self, phrases: Phrases):
+        counts = self.term_counts(phrases)
+        n_phrases = max(counts["phrase"].nunique(), 1)
+        document_frequency = counts.groupby("term")["phrase"].nunique()
+        self.idf : pd.Series = np.log((1 + n_phrases) / (1 + document_frequency)) + 1
+        # Weight of the terms never seen during fit
+        self.default_idf = np.log(1 + n_phrases) + 1
+
+        return self
+
+    def term_counts(self, phrases: Phrases) -> pd.DataFrame:
+        words = tokenize(phrases).explode().dropna()
+        terms : Dict[str, List[str]] = {
+            word: word_terms(word)
+            for word in words.unique()
+        }
+        df = pd.DataFrame({"phrase": words.index, "term": words.map(terms).to_numpy()})
+        df = df.explode("term")
+
+        return df.groupby(["phrase", "term"]).size().rename("count").reset_index()
+
+    def transform(self, phrases: Phrases) -> pd.DataFrame:
+        df = self.term_counts(phrases)
+        df["weight"] = df["count"] * df["term"].map(self.idf).fillna(self.default_idf)
+        norm = np.sqrt((df["weight"] ** 2).groupby(df["phrase"]).transform("sum"))
+        df["weight"] = df["weight"] / norm
+
+        return df[["phrase", "term", "weight"]]
+
+
+def prefixes(vectors: pd.DataFrame, threshold: float) -> pd.DataFrame:
+    """
+    Leading terms of each vector in the order of the term codes, up to the
+    point where the norm of the remaining terms is below the threshold
+    """
+    df = vectors.sort_values(["phrase", "term"], ascending=[True, False])
+    tail_norm = np.sqrt((df["weight"] ** 2).groupby(df["phrase"]).cumsum())
+
+    return df[tail_norm >= threshold].sort_values(["phrase", "term"])
+
+
+def expand(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """
+    Positions of the ranges [start, start + length) one after the other
+    """
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
+
+
+class SparseVectors:
+    """
+    Vectors of phrases in compressed sparse rows: the terms and weights of the
+    phrase i are at the positions [starts[i], starts[i] + lengths[i])
+    """
+    def __init__(self, vectors: pd.DataFrame, n_phrases: int):
+        vectors = vectors.sort_values(["phrase", "term"])
+        self.phrases : np.ndarray = vectors["phrase"].to_numpy()
+        self.terms : np.ndarray = vectors["term"].to_numpy()
+        self.weights : np.ndarray = vectors["weight"].to_numpy()
+        self.lengths : np.ndarray = np.bincount(self.phrases, minlength=n_phrases)
+        self.starts : np.ndarray = np.cumsum(self.lengths) - self.lengths
+
+
+def cosine_similarity(
+        left: pd.DataFrame,
+        right: pd.DataFrame,
+        threshold: float = 0.8,
+        max_candidates: int = MAX_CANDIDATES,
+        ordered: bool = False,
+) -> pd.DataFrame:
+    """
+    Pairs of left and right phrases with a cosine similarity of at least the
+    threshold, with phrase_left < phrase_right if ordered, e.g. when comparing
+    a set of phrases with itself. With the terms ordered from the rarest to the most frequent,
+    two phrases above the threshold always share a term of their prefixes,
+    so only those pairs are compared. Common terms rarely make it into a
+    prefix and the left phrases are compared in chunks of about
+    max_candidates pairs, which bounds the memory on large exports.
+    """
+    if left.empty or right.empty:
+        return pd.DataFrame(
+            {
+                "phrase_left": pd.Series(dtype=int),
+                "phrase_right": pd.Series(dtype=int),
+                "similarity": pd.Series(dtype=float),
+            }
+        )
+
+    # Integer code of the terms, from the rarest to the most frequent
+    frequency = pd.concat([left["term"], right["term"]]).value_counts(ascending=True)
+    codes = pd.Series(np.arange(len(frequency)), index=frequency.index)
+    left = left.assign(term=left["term"].map(codes).to_numpy())
+    right = right.assign(term=right["term"].map(codes).to_numpy())
+    n_left = int(left["phrase"].max()) + 1
+    n_right = int(right["phrase"].max()) + 1
+
+    left_vectors = SparseVectors(left, n_left)
+    right_vectors = SparseVectors(right, n_right)
+    # Sorted keys of the right vectors to look up the weight of a phrase and term
+    right_keys = right_vectors.phrases * len(codes) + right_vectors.terms
+
+    left_prefixes = SparseVectors(prefixes(left, threshold), n_left)
+    # Phrases of each term in the right prefixes
+    postings = prefixes(right, threshold).sort_values(["term", "phrase"])
+    posting_phrases = postings["phrase"].to_numpy()
+    posting_lengths = np.bincount(postings["term"], minlength=len(codes))
+    posting_starts = np.cumsum(posting_lengths) - posting_lengths
+
+    # Chunks of left phrases with about max_candidates candidate pairs
+    n_candidates = np.bincount(
+        left_prefixes.phrases,
+        weights=posting_lengths[left_prefixes.terms],
+        minlength=n_left,
+    )
+    chunk_ids = np.cumsum(n_candidates) // max(max_candidates, 1)
+    chunks = np.split(np.arange(n_left), np.flatnonzero(np.diff(chunk_ids)) + 1)
+
+    similarities = []
+    for chunk in chunks:
+        # Candidate pairs sharing a prefix term
+        rows = expand(left_prefixes.starts[chunk], left_prefixes.lengths[chunk])
+        terms = left_prefixes.terms[rows]
+        n_postings = posting_lengths[terms]
+        pairs = np.unique(
+            np.repeat(left_prefixes.phrases[rows], n_postings) * n_right
+            + posting_phrases[expand(posting_starts[terms], n_postings)]
+        )
+        if ordered:
+            pairs = pairs[pairs // n_right < pairs % n_right]
+        phrase_left, phrase_right = pairs // n_right, pairs % n_right
+
+        # Dot product of the candidate pairs over the terms of the left phrase
+        n_terms = left_vectors.lengths[phrase_left]
+        pair = np.repeat(np.arange(len(pairs)), n_terms)
+        positions = expand(left_vectors.starts[phrase_left], n_terms)
+        keys = phrase_right[pair] * len(codes) + left_vectors.terms[positions]
+        matches = np.minimum(np.searchsorted(right_keys, keys), len(right_keys) - 1)
+        shared = right_keys[matches] == keys
+        similarity = np.bincount(
+            pair[shared],
+            weights=left_vectors.weights[positions[shared]] * right_vectors.weights[matches[shared]],
+            minlength=len(pairs),
+        )
+
+        above = similarity >= threshold - 1e-9
+        similarities.append(
+            pd.DataFrame(
+                {
+                    "phrase_left": phrase_left[above],
+                    "phrase_right": phrase_right[above],
+                    "similarity": similarity[above],
+                }
+            )
+        )
+
+    return pd.concat(similarities, ignore_index=True)
+
+
+def leader_clusters(
+        n_nodes: int,
+        left: np.ndarray,
+        right: np.ndarray,
+        similarity: np.ndarray,
+) -> np.ndarray:
+    """
+    Cluster label of each node given the similar pairs (left < right). Nodes
+    are taken in order: a node joins the most similar earlier leader it is
+    similar to, or else leads a new cluster. Every node is similar to the
+    leader of its cluster, so clusters never grow through chains of near
+    duplicates. The label is the leader.
+    """
+    order = np.argsort(right, kind="stable")
+    left, right, similarity = left[order], right[order], similarity[order]
+    bounds = np.searchsorted(right, np.arange(n_nodes + 1))
+
+    labels = np.arange(n_nodes)
+    is_leader = np.ones(n_nodes, dtype=bool)
+    for node in range(n_nodes):
+        neighbours = left[bounds[node]:bounds[node + 1]]
+        leaders = is_leader[neighbours]
+        if leaders.any():
+            scores = similarity[bounds[node]:bounds[node + 1]][leaders]
+            labels[node] = neighbours[leaders][np.argmax(scores)]
+            is_leader[node] = False
+
+    return labels
+
+
+class PhraseIndex:
+    """
+    Index of phrases, e.g. the tracked keywords, to find in bulk the near
+    duplicates of other phrases
+    """
+    def __init__(self, phrases: Phrases):
+        self.phrases = pd.Series(phrases, dtype=object).drop_duplicates().reset_index(drop=True)
+        self.vectorizer = PhraseVectorizer().fit(self.phrases)
+        self.vectors = self.vectorizer.transform(self.phrases)
+
+    def near_duplicates(self, queries: Phrases, threshold: float = 0.8) -> pd.DataFrame:
+        """
+        Indexed phrases similar to each query
+        """
+        queries = pd.Series(queries, dtype=object).reset_index(drop=True)
+        similarity = cosine_similarity(
+            self.vectorizer.transform(queries),
+            self.vectors,
+            threshold=threshold,
+        )
+
+        return pd.DataFrame(
+            {
+                "Query": queries.to_numpy()[similarity["phrase_left"]],
+                "Match": self.phrases.to_numpy()[similarity["phrase_right"]],
+                "Similarity": similarity["similarity"].to_numpy(),
+            }
+        )
+
+    def best_matches(self, queries: Phrases, threshold: float = 0.8) -> pd.DataFrame:
+        """
+        Most similar indexed phrase of each query with a near duplicate
+        """
+        return self.near_duplicates(queries, threshold).sort_values(
+            "Similarity",
+            ascending=False,
+        ).drop_duplicates("Query")
+
+
+def cluster_phrases(phrases: Phrases, threshold: float = 0.8) -> np.ndarray:
+    """
+    Cluster label of each phrase. The phrases are taken in order, e.g. by
+    search volume, and each one joins the cluster of the most similar earlier
+    leading phrase it is a near duplicate of, or leads a new cluster. The
+    label is the position of the leading phrase.
+    """
+    phrases = pd.Series(phrases, dtype=object).reset_index(drop=True)
+    # Word order and plural variants have the same vector, so they are only compared once
+    words = tokenize(phrases).map(lambda w: " ".join(sorted(w)))
+    variants, unique_words = pd.factorize(words)
+    unique_words = pd.Series(unique_words, dtype=object)
+
+    vectors = PhraseVectorizer().fit(unique_words).transform(unique_words)
+    similarity = cosine_similarity(vectors, vectors, threshold=threshold, ordered=True)
+    labels = leader_clusters(
+        len(unique_words),
+        similarity["phrase_left"].to_numpy(),
+        similarity["phrase_right"].to_numpy(),
+        similarity["similarity"].to_numpy(),
+    )
+
+    # Factorize numbers the variants by first appearance, so the variants are
+    # taken in the order of the phrases and the label is the position of the
+    # first phrase of the leading variant
+    first_phrase = pd.Series(np.arange(len(phrases))).groupby(variants).min().to_numpy()
+
+    return first_phrase[labels[variants]]
+
+
+def campaign_groups(df: pd.DataFrame, threshold: float = 0.8) -> pd.DataFrame:
+    """
+    Suggest the campaigns of keyword phrases
+
+    The phrases of each campaign structure are grouped into campaigns of at
+    most 1, 5 or 10 keywords, All KW in a single campaign. Near duplicate
+    phrases are clustered and each cluster starts a new campaign, so a
+    campaign only targets the variants of a phrase; a cluster larger than
+    the campaign size is split into campaigns in search volume order. Each
+    campaign is named after its highest search volume phrase.
+
+    Parameters:
+        df: dataframe with the columns Keyword Phrase, Search Volume and Campaign Structure
+    """
+    df = df.sort_values(
+        "Search Volume",
+        ascending=False,
+        kind="stable",
+    ).reset_index(drop=True)
+    df["Cluster"] = cluster_phrases(df["Keyword Phrase"], threshold=threshold)
+
+    # Clusters in order of their highest search volume phrase
+    df["Campaign Structure"] = pd.Categorical(
+        df["Campaign Structure"],
+        categories=[s.value for s in CampaignStructure],
+    )
+    df = df.sort_values(["Campaign Structure", "Cluster"], kind="stable")
+    # Labels are positions before the sort, kept by the index
+    df["Cluster"] = df.loc[df["Cluster"], "Keyword Phrase"].to_numpy()
+
+    # Campaigns never mix clusters, except All KW which is a single campaign
+    size = df["Campaign Structure"].map(CAMPAIGN_SIZES).astype(float)
+    single_campaign = size.isna().to_numpy()
+    campaign_keys = pd.DataFrame(
+        {
+            "Campaign Structure": df["Campaign Structure"],
+            "Cluster": np.where(single_campaign, "", df["Cluster"]),
+            "Campaign Number": np.where(
+                single_campaign,
+                0,
+                df.groupby(["Campaign Structure", "Cluster"], observed=True).cumcount() // size.fillna(1),
+            ),
+        },
+        index=df.index,
+    )
+    campaign = campaign_keys.groupby(list(campaign_keys.columns), observed=True, sort=False).ngroup()
+    # A cluster may be led by a phrase of another structure, so the top
+    # phrase of each campaign is taken by search volume
+    top_phrase = (
+        df["Keyword Phrase"]
+        .groupby(campaign)
+        .transform(lambda phrases: phrases.loc[df.loc[phrases.index, "Search Volume"].idxmax()])
+    )
+    df["Campaign"] = df["Campaign Structure"].astype(str) + " - " + top_phrase
+
+    return df.reset_index(drop=True)
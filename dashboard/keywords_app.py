@@ -4,21 +4,65 @@ Analyse the current state and evolution in time of the keywords saved in keyword
 """
 
 import streamlit as st
-from keywords.classes import Keywords, KeywordsRepository
+from keywords.classes import (
+    Keywords, 
+    KeywordsRepository, 
+    KeywordSearchIndex, 
+    SharedKeywordsRepository,
+)
+from keywords.similarity import PhraseIndex, cluster_phrases, campaign_groups
 from ppc.data_readers import KeywordTrackerMergedSQP, CerebroReader
 from datetime import datetime, date
 import pandas as pd
 from typing import List
+from upload_cache import read_upload
 
 
-KEYWORDS_REPOSITORY_PATH = "keywords/repository.json"
-KEYWORDS_REPOSITORY_PATH_BACKUP =  "keywords/repository_backup.json"
+KEYWORDS_REPOSITORY_PATH = "keywords/repository"
+# Repository saved as a single .json file, migrated on the first run
+KEYWORDS_REPOSITORY_JSON_PATH = "keywords/repository.json"
+
+
+def keyword_picker(
+        search_index: KeywordSearchIndex, 
+        label: str, 
+        key: str, 
+        multiple: bool = True,
+):
+    """
+    Keyword selection with server side search, only the keywords found and the
+    current selection are sent to the widget
+    """
+    query = st.text_input(f"Search - {label}", key=f"{key}-search")
+    selection = st.session_state.get(key)
+    if selection is None:
+        selection = []
+    elif not multiple:
+        selection = [selection]
+
+    options = search_index.search(query)
+    options += [k for k in selection if k not in options]
+
+    if multiple:
+        return st.multiselect(label, options=options, key=key)
+
+    return st.selectbox(label, options=options, key=key)
+
+
+@st.cache_resource
+def shared_keywords_repository() -> SharedKeywordsRepository:
+    """
+    Keywords repository of the process, loaded once and shared by every session
+    """
+    if not KeywordsRepository.exists(KEYWORDS_REPOSITORY_PATH):
+        KeywordsRepository.load_json(KEYWORDS_REPOSITORY_JSON_PATH).save(KEYWORDS_REPOSITORY_PATH)
+
+    return SharedKeywordsRepository(KEYWORDS_REPOSITORY_PATH)
 
 
 def app():
 
-    #if "keywords_repository" not in st.session_state:
-    st.session_state["keywords_repository"] = KeywordsRepository.load(KEYWORDS_REPOSITORY_PATH)
+    shared_repository = shared_keywords_repository()
 
     st.title("Tracked Keywords Analysis")
     st.header("Read Helium10 Keyword Tracker and Search Query Performance Report")
@@ -36,25 +80,21 @@ def app():
         if not date_k:
             date_k = date.today()
 
-        df_merged = KeywordTrackerMergedSQP(search_volume_min=1).read([uploader_kt, uploader_sqr])
+        df_merged = read_upload(
+            KeywordTrackerMergedSQP(search_volume_min=1),
+            [uploader_kt, uploader_sqr],
+        )
         
-        # Load keywords repository
+        # Update keywords repository
         if update_repository:
-            keywords_repository = KeywordsRepository.load(KEYWORDS_REPOSITORY_PATH)
-            keywords_repository.save(KEYWORDS_REPOSITORY_PATH_BACKUP)
             # Convert dataframe into a class Keywords
             keywords : Keywords = Keywords.from_dataframe(
                 tracking_date=date_k,
                 df=df_merged,
             )
             
-            # Add keywords read into the repository
-            keywords_repository.add(keywords)
-
-            st.session_state["keywords_repository"] = keywords_repository
-
-            # Save updated repository
-            keywords_repository.save(KEYWORDS_REPOSITORY_PATH)
+            # Add and save the keywords read as a new version of the shared repository
+            shared_repository.add(keywords)
 
 
         keyword_tracker = df_merged.query("Keyword != '-'")
@@ -141,15 +181,17 @@ def app():
     # Keywords Repository Analysis
     keywords_repository_analysis = st.checkbox("Keywords Repository Analysis")
     if keywords_repository_analysis:
-        keywords_repository = st.session_state["keywords_repository"]
+        # Same version for the whole run, even if another session adds a tracking date
+        keywords_repository = shared_repository.current()
         st.title("Keywords Repository Analysis")
         st.write("- Unique Tracking Dates: ", keywords_repository.tracking_dates)
         st.plotly_chart(keywords_repository.total_search_volume_viz())
         st.plotly_chart(keywords_repository.organic_rank_classification_viz())
         st.plotly_chart(keywords_repository.search_volume_per_organic_rank_classification_viz())
-        keywords_to_analyse = st.multiselect(
+        keywords_to_analyse = keyword_picker(
+            keywords_repository.search_index(),
             "Select keywords to analyze", 
-            options=keywords_repository.keyword_tracker_history()["Keyword"].unique()
+            key="keywords-to-analyse",
         )
         if keywords_to_analyse:
             metric = st.selectbox(
@@ -162,14 +204,59 @@ def app():
                 ]
             )
             st.plotly_chart(keywords_repository.keywords_evolution_viz(keywords_to_analyse, metric))
+
+        st.subheader("Week-over-week Organic Rank Movers")
+        movers = keywords_repository.matrices().movers("Organic Rank", days=7)
+        st.write("- Top Gainers: ")
+        st.write(movers.query("Change < 0").head(20))
+        st.write("- Top Losers: ")
+        st.write(movers.query("Change > 0").sort_values("Change", ascending=False).head(20))
+
+        st.subheader("Organic Rank Movements")
+        col_from, col_to = st.columns(2)
+        from_date = col_from.selectbox(
+            "From", 
+            options=keywords_repository.tracking_dates, 
+            index=max(len(keywords_repository.tracking_dates) - 2, 0),
+        )
+        to_date = col_to.selectbox(
+            "To", 
+            options=keywords_repository.tracking_dates,
+            index=len(keywords_repository.tracking_dates) - 1,
+        )
+        movements = keywords_repository.rank_movements(from_date, to_date)
+        st.write("- Classification Transitions: ")
+        st.write(
+            movements.query("Transition != '-'").groupby("Transition").agg(
+                Keywords=("Keyword", "count"),
+                SearchVolume=("Search Volume", "sum"),
+            ).reset_index()
+        )
+        st.write(movements.sort_values("Impact", ascending=False))
         
-        keyword_cvr = st.selectbox(
+        keyword_cvr = keyword_picker(
+            keywords_repository.search_index(),
             "Select keywords for conversion rate comparison", 
-            options=keywords_repository.keyword_tracker_history()["Keyword"].unique()
+            key="keyword-cvr",
+            multiple=False,
         )
         if keyword_cvr:
             st.plotly_chart(keywords_repository.keywords_relative_CVR_viz(keyword_cvr))
 
+        st.subheader("H10 vs SQP Search Volume")
+        st.write("- Note: Keywords selected to analyze or the top 20 keywords by H10 search volume.")
+        st.plotly_chart(
+            keywords_repository.search_volume_reconciliation_viz(keywords_to_analyse),
+            use_container_width=True,
+        )
+        reconciliation = keywords_repository.matrices().search_volume_reconciliation()
+        st.write("- Largest Ratio Drifts: ")
+        st.write(
+            reconciliation.loc[
+                reconciliation["Drift (%)"].abs().sort_values(ascending=False).index
+            ].drop_duplicates("Keyword").head(20)
+        )
+
     
     st.write("***")
 
@@ -182,11 +269,20 @@ def app():
         uploader_cerebro_r = st.file_uploader("Upload Helium10 Cerebro", type=[".xlsx"])
         # Search Query Performance Report
         uploader_sqr_r = st.file_uploader("Upload Search Query Performance Report", type=[".csv"])
+        similarity_threshold = st.slider(
+            "Near Duplicate Similarity", 
+            min_value=0.5, 
+            max_value=1.0, 
+            value=0.8,
+        )
         submit_r = st.form_submit_button("Submit")
 
     if submit_r:
-        df_merged_r = KeywordTrackerMergedSQP(search_volume_min=1).read([uploader_kt_r, uploader_sqr_r])
-        df_cerebro_r = CerebroReader(search_volume_min=1).read(uploader_cerebro_r)
+        df_merged_r = read_upload(
+            KeywordTrackerMergedSQP(search_volume_min=1),
+            [uploader_kt_r, uploader_sqr_r],
+        )
+        df_cerebro_r = read_upload(CerebroReader(search_volume_min=1), uploader_cerebro_r)
         
         df_r = pd.merge(
             df_cerebro_r,
@@ -200,12 +296,41 @@ def app():
         df_r["ASIN"] = df_r["ASIN"].fillna("-")
         df_r = df_r.query("ASIN == '-'")
 
+        # Filter out word order and plural variants of the tracked keywords
+        tracked_index = PhraseIndex(df_merged_r.query("Keyword != '-'")["Keyword"])
+        variants = tracked_index.best_matches(
+            df_r["Keyword Phrase"], 
+            threshold=similarity_threshold,
+        ).rename(columns={"Query": "Keyword Phrase", "Match": "Tracked Keyword"})
+        df_r = pd.merge(df_r, variants, how="left", on="Keyword Phrase")
+
+        st.subheader("Variants of keywords already being tracked")
+        df_variants = df_r.dropna(subset=["Tracked Keyword"])
+        st.write("- Total: ", len(df_variants))
+        st.write(df_variants[["Keyword Phrase", "Tracked Keyword", "Similarity", "Search Volume_x"]])
+
+        df_r = df_r[df_r["Tracked Keyword"].isna()].reset_index(drop=True)
+
+        # Collapse the near duplicates into clusters named after their highest search volume phrase
+        df_r["Cluster"] = df_r["Keyword Phrase"].to_numpy()[
+            cluster_phrases(df_r["Keyword Phrase"], threshold=similarity_threshold)
+        ]
+
         st.subheader("Keywords found not yet being tracked")
+        st.write("- Total: ", len(df_r))
+        st.write("- Clusters: ", df_r["Cluster"].nunique())
+        st.write(
+            df_r.groupby("Cluster").agg(
+                Phrases=("Keyword Phrase", "count"),
+                SearchVolume=("Search Volume_x", "sum"),
+            ).sort_values("SearchVolume", ascending=False).reset_index()
+        )
 
         # Filter columns 
         df_r = df_r[
             [
                 "Keyword Phrase",
+                "Cluster",
                 "Search Volume_x",
                 "Organic Rank_x",
                 #"Sponsored Rank",
@@ -225,7 +350,28 @@ def app():
         ]
 
         st.write(df_r)
-        
+
+        st.subheader("Campaign Suggestions")
+        st.write("- Note: Cerebro and Keyword Tracker phrases grouped by campaign structure and similarity.")
+        df_phrases = pd.concat(
+            [
+                df_cerebro_r[["Keyword Phrase", "Search Volume", "Campaign Structure"]],
+                df_merged_r.query("Keyword != '-'").rename(
+                    columns={"Keyword": "Keyword Phrase"}
+                )[["Keyword Phrase", "Search Volume", "Campaign Structure"]],
+            ]
+        ).drop_duplicates("Keyword Phrase")
+        df_phrases["Search Volume"] = pd.to_numeric(df_phrases["Search Volume"], errors="coerce").fillna(0)
+        df_campaigns = campaign_groups(df_phrases, threshold=similarity_threshold)
+        st.write("- Campaigns: ", df_campaigns["Campaign"].nunique())
+        st.write(
+            df_campaigns.groupby("Campaign", sort=False).agg(
+                Keywords=("Keyword Phrase", "count"),
+                SearchVolume=("Search Volume", "sum"),
+            ).reset_index()
+        )
+        st.write(df_campaigns[["Campaign", "Keyword Phrase", "Cluster", "Search Volume"]])
+
     
         #test = df_r.query("`Search Volume_x` < 250 and `Organic Rank_x` < 50 and `Organic Rank_x` != 0")
         #for _, x in test.iterrows():
@@ -10,6 +10,7 @@ import copy
 from analysis import DateRange, PPCAnalysis
 from ppc import optimization_functions, data_readers
 from ppc.optimizer import PPCOptimizer
+from upload_cache import read_upload
 
 
 
@@ -35,7 +36,7 @@ def app():
     # Read advertising reports
     report = st.file_uploader("Upload Search Term Report", type=[".xlsx"])
     if report:
-        st.write(data_readers.SearchTermReportReader().read(report))
+        st.write(read_upload(data_readers.SearchTermReportReader(), report))
         # st.write(data_readers.SearchTermReportReader().read(report)[
         #     [
         #         "Campaign Name",
@@ -50,7 +51,7 @@ def app():
     st.title("Read Search Query Performance Data")
     sqp = st.file_uploader("Upload Search Query Performance Data", type=[".csv"])
     if sqp:
-        df = data_readers.SQPReader().read(sqp)
+        df = read_upload(data_readers.SQPReader(), sqp)
         st.write(df)
 
     st.write("***")
@@ -87,12 +88,16 @@ def app():
         #    raise Exception("Mandatory to exclude the last 2 days")
         
         ### Active campaigns data ###
-        st.session_state["campaigns"] = data_readers.ActiveCampaignsReader().read(uploaded_active_campaigns)
+        st.session_state["campaigns"] = read_upload(
+            data_readers.ActiveCampaignsReader(),
+            uploaded_active_campaigns,
+        )
 
         ### Search term report data ###
-        df_search_term_report = data_readers.SearchTermReportReader(
-            date_range=date_range,
-        ).read(uploaded_search_term_report)
+        df_search_term_report = read_upload(
+            data_readers.SearchTermReportReader(date_range=date_range),
+            uploaded_search_term_report,
+        )
         
         search_term_analysis = PPCAnalysis(
             date=date_range,
@@ -108,9 +113,10 @@ def app():
         st.session_state["search_term_report"] = df_search_term_report
 
         ### Search Query Performance Report ###
-        df_kt_sqp = data_readers.KeywordTrackerMergedSQP(
-            search_volume_min=1
-        ).read([uploaded_keyword_tracker, uploaded_sqr])
+        df_kt_sqp = read_upload(
+            data_readers.KeywordTrackerMergedSQP(search_volume_min=1),
+            [uploaded_keyword_tracker, uploaded_sqr],
+        )
         #st.session_state["keyword_tracker+search_query_performance"] = df_kt_sqp
 
         # Instantiate the optimizer
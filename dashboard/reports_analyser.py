@@ -4,9 +4,12 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import pandas as pd
 from dataclasses import dataclass
+from datetime import date
 from typing import Any, List
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from upload_cache import read_upload
+from reports_warehouse import ReportsWarehouse
 
 class ReportsAnalyser(ABC):
     @abstractmethod
@@ -17,10 +20,6 @@ class BusinessReportAnalyser(ReportsAnalyser):
     def read(self, uploader) -> pd.DataFrame:
         df = pd.read_csv(uploader)
         df['Date'] = pd.to_datetime(df['Date'])
-        date_min = df["Date"].min().date()
-        date_max = df["Date"].max().date()
-        st.write("Start Date: ", date_min)
-        st.write("End Date: ", date_max)
         for col in (
             "Ordered Product Sales", 
             "Average Sales per Order Item", 
@@ -37,7 +36,11 @@ class BusinessReportAnalyser(ReportsAnalyser):
         return df
     
     def show(self, uploader):
-        df = self.read(uploader)
+        df = read_upload(self, uploader)
+        date_min = df["Date"].min().date()
+        date_max = df["Date"].max().date()
+        st.write("Start Date: ", date_min)
+        st.write("End Date: ", date_max)
 
         st.write("- Total Product Sales: ", df["Ordered Product Sales"].sum())
         st.write("- Total Units Ordered: ", df["Units Ordered"].sum())
@@ -104,7 +107,10 @@ class CampaignReportAnalyser(ReportsAnalyser):
     def __init__(self, tax: float = 0.23):
         self.tax = tax
 
-    def read(self, uploader) -> pd.DataFrame:
+    def parse(self, uploader) -> pd.DataFrame:
+        """
+        Daily rows per campaign with the currency columns parsed
+        """
         df = pd.read_csv(uploader)
         df['Date'] = pd.to_datetime(df['Date'])
         for col in (
@@ -116,6 +122,15 @@ class CampaignReportAnalyser(ReportsAnalyser):
                 lambda x: float(x.replace("$", "").strip())
             )
 
+        return df
+
+    def read(self, uploader) -> pd.DataFrame:
+        return self.aggregate(self.parse(uploader))
+
+    def aggregate(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Daily totals of all the campaigns
+        """
         grouped = df.groupby("Date").sum()[
             [
                 "Budget",
@@ -157,7 +172,7 @@ class CampaignReportAnalyser(ReportsAnalyser):
         ]
 
     def show(self, uploader):
-        df = self.read(uploader)
+        df = read_upload(self, uploader)
         date_min = df["Date"].min().date()
         date_max = df["Date"].max().date()
         st.write("Start Date: ", date_min)
@@ -322,8 +337,27 @@ class DailyPerformanceReportAnalyser(ReportsAnalyser):
         
     def read(self, uploader: Reports) -> pd.DataFrame:
         df_business = BusinessReportAnalyser().read(uploader.business)
-        df_ppc = CampaignReportAnalyser(tax=0.23).read(uploader.ppc)
+        df_ppc = CampaignReportAnalyser(tax=self.tax).read(uploader.ppc)
+
+        return self.merge(df_business, df_ppc)
+
+    def read_warehouse(
+            self,
+            warehouse: ReportsWarehouse,
+            start_date: date,
+            end_date: date,
+    ) -> pd.DataFrame:
+        """
+        Daily performance of a date range stored in the reports warehouse
+        """
+        df_business = warehouse.business_report(start_date, end_date)
+        df_ppc = CampaignReportAnalyser(tax=self.tax).aggregate(
+            warehouse.campaign_report(start_date, end_date)
+        )
+
+        return self.merge(df_business, df_ppc)
 
+    def merge(self, df_business: pd.DataFrame, df_ppc: pd.DataFrame) -> pd.DataFrame:
         # Change names of ppc columns
         df_ppc = df_ppc.rename(
             columns={
@@ -535,7 +569,12 @@ class DailyPerformanceReportAnalyser(ReportsAnalyser):
 
 
     def show(self, uploader: Reports):
-        df = self.read(uploader)
+        self.display(read_upload(self, uploader))
+
+    def show_warehouse(self, warehouse: ReportsWarehouse, start_date: date, end_date: date):
+        self.display(self.read_warehouse(warehouse, start_date, end_date))
+
+    def display(self, df: pd.DataFrame):
         st.write(df)
 
         #Clicks and sessions
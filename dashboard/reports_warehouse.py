@@ -0,0 +1,239 @@
+"""
+Local warehouse of the daily Business Reports and Sponsored Products Campaign Reports
+
+The reports are stored in a SQLite file, so the performance analysis of any
+date range can be made without uploading the reports again.
+
+Ingest reports from the command line:
+    python reports_warehouse.py business "BusinessReport.csv" --asin B0C4FZJJ5W
+    python reports_warehouse.py campaign "Sponsored Products Campaign report.csv"
+"""
+
+import argparse
+import sqlite3
+from datetime import date
+from typing import Union
+from pathlib import Path
+import pandas as pd
+
+
+WAREHOUSE_PATH = "reports_warehouse.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS business_report (
+    date TEXT NOT NULL,
+    asin TEXT NOT NULL,
+    sessions INTEGER,
+    units_ordered INTEGER,
+    total_order_items INTEGER,
+    ordered_product_sales REAL,
+    PRIMARY KEY (asin, date)
+);
+CREATE INDEX IF NOT EXISTS business_report_date ON business_report (date);
+
+CREATE TABLE IF NOT EXISTS campaign_report (
+    date TEXT NOT NULL,
+    campaign TEXT NOT NULL,
+    budget REAL,
+    impressions INTEGER,
+    clicks INTEGER,
+    spend REAL,
+    total_orders INTEGER,
+    total_sales REAL,
+    PRIMARY KEY (campaign, date)
+);
+CREATE INDEX IF NOT EXISTS campaign_report_date ON campaign_report (date);
+"""
+
+
+class ReportsWarehouse:
+    """
+    Embedded warehouse of daily reports
+
+    Attributes:
+        path: path of the SQLite file
+    """
+    def __init__(self, path: Union[str, Path] = WAREHOUSE_PATH):
+        self.path = path
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def ingest_business_report(self, df: pd.DataFrame, asin: str = "-") -> int:
+        """
+        Insert or update the daily rows of a Business Report read by the
+        BusinessReportAnalyser. Returns the number of rows ingested.
+        """
+        asins = df["ASIN"] if "ASIN" in df.columns else [asin] * len(df)
+        rows = list(
+            zip(
+                df["Date"].dt.strftime("%Y-%m-%d"),
+                asins,
+                df["Sessions - Total"].astype(int).tolist(),
+                df["Units Ordered"].astype(int).tolist(),
+                df["Total Order Items"].astype(int).tolist(),
+                df["Ordered Product Sales"].astype(float).tolist(),
+            )
+        )
+        with self.connect() as connection:
+            connection.executemany(
+                """
+                INSERT INTO business_report VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (asin, date) DO UPDATE SET
+                    sessions = excluded.sessions,
+                    units_ordered = excluded.units_ordered,
+                    total_order_items = excluded.total_order_items,
+                    ordered_product_sales = excluded.ordered_product_sales
+                """,
+                rows,
+            )
+
+        return len(rows)
+
+    def ingest_campaign_report(self, df: pd.DataFrame) -> int:
+        """
+        Insert or update the daily rows per campaign of a Campaign Report parsed
+        by the CampaignReportAnalyser. Returns the number of rows ingested.
+        """
+        rows = list(
+            zip(
+                df["Date"].dt.strftime("%Y-%m-%d"),
+                df["Campaign Name"],
+                df["Budget"].astype(float).tolist(),
+                df["Impressions"].astype(int).tolist(),
+                df["Clicks"].astype(int).tolist(),
+                df["Spend"].astype(float).tolist(),
+                df["7 Day Total Orders (#)"].astype(int).tolist(),
+                df["7 Day Total Sales "].astype(float).tolist(),
+            )
+        )
+        with self.connect() as connection:
+            connection.executemany(
+                """
+                INSERT INTO campaign_report VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (campaign, date) DO UPDATE SET
+                    budget = excluded.budget,
+                    impressions = excluded.impressions,
+                    clicks = excluded.clicks,
+                    spend = excluded.spend,
+                    total_orders = excluded.total_orders,
+                    total_sales = excluded.total_sales
+                """,
+                rows,
+            )
+
+        return len(rows)
+
+    def date_range(self) -> tuple:
+        """
+        First and last date with both business and campaign data
+        """
+        with self.connect() as connection:
+            start_date, end_date = connection.execute(
+                """
+                SELECT MAX(b.start_date, c.start_date), MIN(b.end_date, c.end_date)
+                FROM (SELECT MIN(date) AS start_date, MAX(date) AS end_date FROM business_report) AS b,
+                     (SELECT MIN(date) AS start_date, MAX(date) AS end_date FROM campaign_report) AS c
+                """
+            ).fetchone()
+
+        if start_date is None or end_date is None:
+            return None, None
+
+        return date.fromisoformat(start_date), date.fromisoformat(end_date)
+
+    def query(self, sql: str, start_date: date, end_date: date) -> pd.DataFrame:
+        with self.connect() as connection:
+            df = pd.read_sql_query(
+                sql,
+                connection,
+                params=(start_date.isoformat(), end_date.isoformat()),
+            )
+        df["Date"] = pd.to_datetime(df["Date"])
+
+        return df
+
+    def business_report(self, start_date: date, end_date: date) -> pd.DataFrame:
+        """
+        Daily totals of all ASINs, with the columns of BusinessReportAnalyser.read
+        """
+        df = self.query(
+            """
+            SELECT
+                date AS "Date",
+                SUM(ordered_product_sales) AS "Ordered Product Sales",
+                SUM(units_ordered) AS "Units Ordered",
+                SUM(total_order_items) AS "Total Order Items",
+                SUM(sessions) AS "Sessions - Total"
+            FROM business_report
+            WHERE date BETWEEN ? AND ?
+            GROUP BY date
+            ORDER BY date
+            """,
+            start_date,
+            end_date,
+        )
+        df["Average Sales per Order Item"] = df.eval(
+            "`Ordered Product Sales` / `Total Order Items`"
+        )
+        df["Average Selling Price"] = df.eval(
+            "`Ordered Product Sales` / `Units Ordered`"
+        )
+        df["Conversion Rate (%)"] = df.eval(
+            "`Total Order Items`*100 / `Sessions - Total`"
+        )
+
+        return df
+
+    def campaign_report(self, start_date: date, end_date: date) -> pd.DataFrame:
+        """
+        Daily rows per campaign, with the columns of CampaignReportAnalyser.parse
+        """
+        return self.query(
+            """
+            SELECT
+                date AS "Date",
+                campaign AS "Campaign Name",
+                budget AS "Budget",
+                impressions AS "Impressions",
+                clicks AS "Clicks",
+                spend AS "Spend",
+                total_orders AS "7 Day Total Orders (#)",
+                total_sales AS "7 Day Total Sales "
+            FROM campaign_report
+            WHERE date BETWEEN ? AND ?
+            ORDER BY date, campaign
+            """,
+            start_date,
+            end_date,
+        )
+
+
+def main():
+    from reports_analyser import BusinessReportAnalyser, CampaignReportAnalyser
+
+    parser = argparse.ArgumentParser(description="Ingest reports into the warehouse")
+    parser.add_argument("report", choices=["business", "campaign"])
+    parser.add_argument("path", help="Path of the report .csv file")
+    parser.add_argument("--asin", default="-", help="ASIN of the Business Report")
+    parser.add_argument("--warehouse", default=WAREHOUSE_PATH)
+    args = parser.parse_args()
+
+    warehouse = ReportsWarehouse(args.warehouse)
+    if args.report == "business":
+        n_rows = warehouse.ingest_business_report(
+            BusinessReportAnalyser().read(args.path),
+            asin=args.asin,
+        )
+    else:
+        n_rows = warehouse.ingest_campaign_report(
+            CampaignReportAnalyser().parse(args.path)
+        )
+
+    print(f"Ingested {n_rows} rows into {args.warehouse}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The dashboard modules import each other from the dashboard directory, as when
+# the app runs from it
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,96 @@
+import json
+from datetime import date
+import pytest
+from accounting.cash_flow import CashFlow, DuplicateTransaction
+from accounting.transaction import Transaction, TransactionType
+
+
+def transaction(amount: float = -25.0, description: str = "Sample order") -> Transaction:
+    return Transaction(
+        type=TransactionType.OPERATIONS,
+        date=date(2023, 10, 1),
+        amount=amount,
+        description=description,
+    )
+
+
+def contents(cash_flow: CashFlow) -> list:
+    return [(t.id, t.content()) for t in cash_flow.transactions]
+
+
+@pytest.fixture
+def ledger_path(tmp_path) -> str:
+    path = tmp_path / "past_transactions.json"
+    path.write_text(json.dumps([transaction(1000.0, "Initial capital").dict()]))
+
+    return str(path)
+
+
+def test_journal_replayed_over_snapshot_including_it(ledger_path):
+    cash_flow = CashFlow(ledger_path)
+    cash_flow.add_transaction(transaction())
+    cash_flow.add_transaction(transaction(-10.0))
+    cash_flow.remove_transaction_by_index(1)
+    cash_flow.save()
+    # The snapshot is written but the journal not removed yet
+    cash_flow.dump(cash_flow.parsable_transactions(), backup=True)
+
+    reopened = CashFlow(ledger_path)
+
+    assert contents(reopened) == contents(cash_flow)
+    assert reopened.balances == cash_flow.balances
+
+
+def test_crash_between_snapshot_replace_and_journal_removal(ledger_path, monkeypatch):
+    cash_flow = CashFlow(ledger_path)
+    cash_flow.add_transaction(transaction())
+    cash_flow.save()
+
+    def crash(path):
+        raise OSError("crash")
+
+    monkeypatch.setattr("accounting.cash_flow.os.remove", crash)
+    with pytest.raises(OSError):
+        cash_flow.compact()
+    monkeypatch.undo()
+
+    reopened = CashFlow(ledger_path)
+
+    assert contents(reopened) == contents(cash_flow)
+    with open(f"{ledger_path}_backup.json") as f:
+        assert len(json.load(f)) == 1
+
+
+def test_remove_then_add_same_content(ledger_path):
+    cash_flow = CashFlow(ledger_path)
+    cash_flow.add_transaction(transaction())
+    id = cash_flow.transactions[-1].id
+    cash_flow.remove_transaction_by_id(id)
+    cash_flow.add_transaction(transaction())
+    cash_flow.save()
+
+    reopened = CashFlow(ledger_path)
+
+    assert len(reopened) == 2
+    assert reopened.transactions[-1].id == id
+    reopened.compact()
+    assert contents(CashFlow(ledger_path)) == contents(reopened)
+
+
+def test_duplicate_across_instances(ledger_path):
+    first = CashFlow(ledger_path)
+    second = CashFlow(ledger_path)
+    first.add_transaction(transaction())
+    first.save()
+
+    with pytest.raises(DuplicateTransaction):
+        CashFlow(ledger_path).add_transaction(transaction())
+
+    # An instance opened before the save gives the transaction the same id,
+    # so replaying both journaled adds keeps a single copy
+    second.add_transaction(transaction())
+    second.save()
+
+    reopened = CashFlow(ledger_path)
+    assert len(reopened) == 2
+    assert reopened.balances[TransactionType.OPERATIONS] == 975.0
@@ -0,0 +1,31 @@
+import os
+import pandas as pd
+from keywords.classes import KeywordsRepository
+
+REPOSITORY_JSON_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    "keywords",
+    "repository.json",
+)
+
+
+def test_segments_round_trip(tmp_path):
+    repository = KeywordsRepository.load_json(REPOSITORY_JSON_PATH)
+    path = str(tmp_path / "repository")
+
+    KeywordsRepository(repository.repository[:3]).save(path)
+    # Each added tracking date is saved in a segment of its own
+    for keywords in repository.repository[3:5]:
+        saved = KeywordsRepository.load(path)
+        saved.add(keywords)
+        saved.save()
+
+    saved = KeywordsRepository.load(path)
+    assert len({partition["file"] for partition in saved.partitions.values()}) == 3
+    pd.testing.assert_frame_equal(saved.snapshot(repository.tracking_dates[4]).df, repository.repository[4].df)
+
+    saved.compact()
+    assert len({partition["file"] for partition in saved.partitions.values()}) == 1
+    for keywords, expected in zip(KeywordsRepository.load(path).repository, repository.repository[:5]):
+        assert keywords.date == expected.date
+        pd.testing.assert_frame_equal(keywords.df, expected.df)
@@ -0,0 +1,41 @@
+import io
+import PIL.Image
+import pytest
+from accounting.receipts import InvalidReceipt, ReceiptProcessor, ReceiptStore, page_count
+
+
+def png() -> bytes:
+    stream = io.BytesIO()
+    PIL.Image.new("RGB", (40, 30), "white").save(stream, format="PNG")
+    return stream.getvalue()
+
+
+def test_invalid_receipt_not_saved(tmp_path):
+    processor = ReceiptProcessor(ReceiptStore(tmp_path))
+
+    assert page_count(png()) == 1
+    with pytest.raises(InvalidReceipt):
+        processor.submit(b"not a document")
+    with pytest.raises(InvalidReceipt):
+        # A truncated image
+        page_count(png()[:len(png()) // 2])
+    assert not any(tmp_path.iterdir())
+
+
+def test_failed_processing_recorded(tmp_path):
+    receipts = ReceiptStore(tmp_path)
+    processor = ReceiptProcessor(receipts)
+    # Saved before the documents were validated
+    digest = receipts.put(b"not a document")
+    processor.schedule(digest)
+    processor.futures[digest].exception()
+
+    assert processor.progress() == (0, 1, 1)
+    assert processor.has_failed(digest)
+    processor.schedule(digest)
+    assert processor.progress() == (0, 0, 0)
+
+    digest = processor.submit(png())
+    processor.futures[digest].result()
+    assert processor.progress() == (1, 0, 1)
+    assert receipts.processed(digest)
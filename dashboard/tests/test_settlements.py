@@ -0,0 +1,33 @@
+import json
+from datetime import date
+import pandas as pd
+from accounting.cash_flow import CashFlow
+from accounting.settlements import parse_amounts
+
+
+def test_parse_amounts():
+    amounts = pd.Series(["1,234", "1,234.56", "1.234,56", "12,5", "-1,234,567"])
+
+    assert parse_amounts(amounts).tolist() == [1234.0, 1234.56, 1234.56, 12.5, -1234567.0]
+
+
+def test_amazon_settlements_deduplicated_by_id(tmp_path):
+    path = tmp_path / "past_transactions.json"
+    path.write_text(json.dumps([]))
+    cash_flow = CashFlow(str(path))
+    settlements = pd.DataFrame(
+        {
+            "Settlement ID": ["1", "2", "2"],
+            "Deposit Date": [date(2023, 10, 5)] * 3,
+            "Amount": [100.0] * 3,
+            "Units Sold": [4] * 3,
+        }
+    )
+
+    # Two settlements paying the same amount on the same date
+    assert cash_flow.amazon_settlements(settlements, cost_per_unit=5.0) == 2
+    assert len(cash_flow.query(description="Amazon payment")) == 2
+
+    # Both are already in the ledger, a third one is not
+    settlements.loc[2, "Settlement ID"] = "3"
+    assert cash_flow.amazon_settlements(settlements, cost_per_unit=5.0) == 1
@@ -0,0 +1,73 @@
+import pandas as pd
+from keywords.similarity import campaign_groups
+
+
+def test_campaign_groups_names():
+    df = pd.DataFrame(
+        {
+            "Keyword Phrase": ["apple pie", "pie apple", "cars", "car", "zebra mat", "zebra mats"],
+            "Search Volume": [500, 400, 20, 1000, 50, 40],
+            "Campaign Structure": ["All KW", "All KW", "All KW", "1 KW", "5 KW", "5 KW"],
+        }
+    )
+
+    groups = campaign_groups(df).set_index("Keyword Phrase")
+
+    assert groups["Cluster"].to_dict() == {
+        "car": "car",
+        "cars": "car",
+        "zebra mat": "zebra mat",
+        "zebra mats": "zebra mat",
+        "apple pie": "apple pie",
+        "pie apple": "apple pie",
+    }
+    assert groups["Campaign"].to_dict() == {
+        "car": "1 KW - car",
+        "zebra mat": "5 KW - zebra mat",
+        "zebra mats": "5 KW - zebra mat",
+        "cars": "All KW - apple pie",
+        "apple pie": "All KW - apple pie",
+        "pie apple": "All KW - apple pie",
+    }
+
+
+def test_campaign_groups_chaining():
+    # Each phrase is similar to the next one, but the first and the last
+    # phrases share a single word
+    df = pd.DataFrame(
+        {
+            "Keyword Phrase": ["pet hair remover", "pet hair remover brush", "hair remover brush", "remover brush"],
+            "Search Volume": [400, 300, 200, 100],
+            "Campaign Structure": ["5 KW", "5 KW", "5 KW", "5 KW"],
+        }
+    )
+
+    groups = campaign_groups(df).set_index("Keyword Phrase")
+
+    assert groups["Cluster"].to_dict() == {
+        "pet hair remover": "pet hair remover",
+        "pet hair remover brush": "pet hair remover",
+        "hair remover brush": "hair remover brush",
+        "remover brush": "hair remover brush",
+    }
+    assert groups["Campaign"].to_dict() == {
+        "pet hair remover": "5 KW - pet hair remover",
+        "pet hair remover brush": "5 KW - pet hair remover",
+        "hair remover brush": "5 KW - hair remover brush",
+        "remover brush": "5 KW - hair remover brush",
+    }
+
+
+def test_campaign_groups_clusters_not_split():
+    df = pd.DataFrame(
+        {
+            "Keyword Phrase": ["car", "cars", "zebra mat", "zebra mats", "yoga block"],
+            "Search Volume": [500, 400, 300, 200, 100],
+            "Campaign Structure": ["10 KW"] * 5,
+        }
+    )
+
+    groups = campaign_groups(df)
+
+    assert groups.groupby("Campaign")["Cluster"].nunique().max() == 1
+    assert groups["Campaign"].nunique() == 3
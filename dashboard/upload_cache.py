@@ -0,0 +1,98 @@
+"""
+Cache the results of reading uploaded reports
+
+Every widget interaction reruns the Streamlit script, so the readers would parse
+the same uploaded files over and over again. The results are cached by the
+content of the uploads and by the reader parameters, which makes them shared
+across reruns and sessions.
+"""
+
+import hashlib
+import io
+from dataclasses import fields, is_dataclass, replace
+from typing import Any
+import pandas as pd
+import streamlit as st
+
+
+# Maximum number of reads kept in memory
+MAX_ENTRIES = 32
+# Number of seconds a read is kept in memory
+TTL = 60 * 60
+
+
+def reader_key(reader: Any) -> str:
+    """
+    Identify a reader by its class and parameters
+    """
+    if hasattr(reader, "__dict__") and not isinstance(reader, type):
+        parameters = ", ".join(
+            f"{name}={reader_key(value)}"
+            for name, value in sorted(vars(reader).items())
+        )
+        return f"{type(reader).__module__}.{type(reader).__qualname__}({parameters})"
+
+    return repr(reader)
+
+
+def upload_digest(uploader: Any) -> str:
+    """
+    Digest of the content of an upload, a list of uploads or a dataclass of uploads
+    """
+    digest = hashlib.sha256()
+    for content in _contents(uploader):
+        digest.update(len(content).to_bytes(8, "little"))
+        digest.update(content)
+
+    return digest.hexdigest()
+
+
+def _contents(uploader: Any):
+    if uploader is None:
+        yield b""
+    elif isinstance(uploader, (list, tuple)):
+        for u in uploader:
+            yield from _contents(u)
+    elif is_dataclass(uploader):
+        for field in fields(uploader):
+            yield from _contents(getattr(uploader, field.name))
+    else:
+        yield uploader.getvalue()
+
+
+def _rewind(uploader: Any) -> Any:
+    """
+    Fresh file objects with the same content, so the readers always start at the beginning
+    """
+    if uploader is None:
+        return None
+    if isinstance(uploader, (list, tuple)):
+        return [_rewind(u) for u in uploader]
+    if is_dataclass(uploader):
+        return replace(
+            uploader,
+            **{
+                field.name: _rewind(getattr(uploader, field.name))
+                for field in fields(uploader)
+            },
+        )
+
+    stream = io.BytesIO(uploader.getvalue())
+    stream.name = getattr(uploader, "name", "")
+    return stream
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, ttl=TTL, show_spinner=False)
+def _read(_reader: Any, _uploader: Any, key: str, digest: str) -> pd.DataFrame:
+    return _reader.read(_rewind(_uploader))
+
+
+def read_upload(reader: Any, uploader: Any) -> pd.DataFrame:
+    """
+    Read the uploaded files with the reader, reusing previous reads of the same content
+
+    Parameters:
+        reader: any object with a read(uploader) method, e.g. a DataReader or a ReportsAnalyser
+        uploader: Streamlit uploaded file, list of uploaded files or dataclass of uploaded files
+    """
+    return _read(reader, uploader, reader_key(reader), upload_digest(uploader))